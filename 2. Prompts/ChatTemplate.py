@@ -129,3 +129,30 @@ response = chain.invoke({
 })
 
 print(response.content)
+
+
+
+# (5) Multi-turn: same template + a MessagesPlaceholder for the conversation history.
+# Replaying every past message makes each turn's prompt bigger than the last one;
+# conversation_memory.py keeps a rolling token window + a summary of older turns
+# (computed in the background) and stores each session in a small file.
+
+'''
+from langchain_core.prompts import MessagesPlaceholder
+from langchain_core.runnables.history import RunnableWithMessageHistory
+from conversation_memory import ConversationStore
+
+chat_prompt = ChatPromptTemplate.from_messages([
+    ("system", "You are an AI recipe assistant specializing in {dietary_preference} dishes that can be made in {cooking_time}."),
+    MessagesPlaceholder("history"),
+    ("human", "{recipe_request}")
+])
+
+store = ConversationStore("chat_sessions", summarizer_llm=ChatOpenAI(model="gpt-4o-mini"), max_tokens=1000)
+chain = RunnableWithMessageHistory(chat_prompt | model, store.get,
+                                   input_messages_key="recipe_request", history_messages_key="history")
+
+config = {"configurable": {"session_id": "user-42"}}
+chain.invoke({"cooking_time": "15 min", "dietary_preference": "Vegan", "recipe_request": "Quick Snack"}, config=config)
+chain.invoke({"cooking_time": "15 min", "dietary_preference": "Vegan", "recipe_request": "Same, but without nuts"}, config=config)
+'''
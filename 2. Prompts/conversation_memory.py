@@ -0,0 +1,360 @@
+#Token-bounded rolling conversation memory for ChatPromptTemplate
+#
+#Adding multi-turn history to the templates in ChatTemplate.py by replaying every past
+#message makes the prompt (and latency, and cost) grow with every turn. Here the history
+#a prompt sees is
+#
+#   [summary of older turns] + [recent turns, at most max_tokens]
+#
+#   - a new turn pushes the oldest whole turns (human message + the replies after it)
+#     out of the window; the most recent turn always stays, shortened in the prompt if it
+#     alone is larger than max_tokens
+#   - evicted turns are folded into the running summary by a background thread, so the
+#     summarizer call is never on the request path; the summary is computed once, stored,
+#     and reused by every later turn (until it is folded into the next one)
+#   - until that summary is ready, the newest evicted turns that still fit in max_tokens are
+#     sent verbatim; the prompt stays bounded even when the summarizer falls behind
+#   - evicted turns waiting for the summarizer are capped at PENDING_LIMIT * max_tokens; if it
+#     keeps failing, the oldest of them are dropped (no summarizer: all of them are dropped)
+#
+#Per session one append-only file <directory>/<session_id>.jsonl, one compact JSON array per line:
+#   ["h","text"]  ["a","text"]  ["s","text"]     human / ai / system message
+#   ["=","summary text"]                         first line only: summary of everything before the file
+#Each new summary, and every drop of evicted turns, rewrites the file as [summary] + the
+#messages still kept, so the file stays about window-sized however long the conversation gets.
+#
+#   chat_prompt = ChatPromptTemplate.from_messages([
+#       ("system", "You are an AI recipe assistant ..."),
+#       MessagesPlaceholder("history"),
+#       ("human", "{recipe_request}"),
+#   ])
+#   store = ConversationStore("chat_sessions", summarizer_llm=ChatOpenAI(model="gpt-4o-mini"), max_tokens=1000)
+#   chain = RunnableWithMessageHistory(chat_prompt | model, store.get,
+#                                      input_messages_key="recipe_request", history_messages_key="history")
+#   chain.invoke({...}, config={"configurable": {"session_id": "user-42"}})
+
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Progressively summarize a conversation. Keep names, numbers, preferences and decisions; "
+               "drop small talk. Answer with the new summary only, at most {max_words} words."),
+    ("human", "Current summary:\n{summary}\n\nNew lines of conversation:\n{lines}\n\nNew summary:"),
+])
+
+_CODES = {"human": "h", "ai": "a", "system": "s"}
+_TYPES = {"h": HumanMessage, "a": AIMessage, "s": SystemMessage}
+_SUMMARY = "="
+_SESSION_ID = re.compile(r"[\w.-]+")
+
+#evicted turns kept for the summarizer, in multiples of max_tokens
+PENDING_LIMIT = 4
+
+#one worker for all sessions: summaries are background work, never worth more threads
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+
+
+def _dumps(record: list) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _check_session_id(session_id: str) -> str:
+    #the id comes from request config and becomes a file name: letters, digits, "_", "-", "."
+    #only, so no separators, drive prefixes ("C:x") or "..", and the file stays in the directory
+    if not _SESSION_ID.fullmatch(session_id or "") or session_id in (".", ".."):
+        raise ValueError(f"invalid session id {session_id!r}: use letters, digits, '_', '-' and '.'")
+    return session_id
+
+
+def _shorten(messages: list[BaseMessage], budget: int,
+             token_counter: Callable[[Sequence[BaseMessage]], int]) -> list[BaseMessage]:
+    """Copies of ``messages`` with the longest texts cut until they fit in ``budget`` tokens."""
+    lengths = [len(m.text) for m in messages]
+    shortened = list(messages)
+    while token_counter(shortened) > budget:
+        i = max(range(len(lengths)), key=lengths.__getitem__)
+        if lengths[i] <= 20:
+            break
+        lengths[i] = lengths[i] * 3 // 4
+        shortened[i] = messages[i].model_copy(update={"content": messages[i].text[:lengths[i]] + " [...]"})
+    return shortened
+
+
+class RollingSummaryHistory(BaseChatMessageHistory):
+    """Chat history of one session: cached summary + a window of recent turns under ``max_tokens``.
+
+    summarizer:    Runnable taking {"summary", "lines", "max_words"} and returning the new summary
+                   (see ``ConversationStore``); None = evicted turns are simply dropped
+    token_counter: messages -> tokens, e.g. ``llm.get_num_tokens_from_messages``; called once
+                   per message, the window size is the sum
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        directory: Path,
+        summarizer: Optional[Runnable] = None,
+        max_tokens: int = 1000,
+        summary_words: int = 150,
+        token_counter: Callable[[Sequence[BaseMessage]], int] = count_tokens_approximately,
+    ):
+        self.session_id = _check_session_id(session_id)
+        self.path = Path(directory) / f"{session_id}.jsonl"
+        self.summarizer = summarizer
+        self.max_tokens = max_tokens
+        self.summary_words = summary_words
+        self.token_counter = token_counter
+        self.summary = ""
+        self.last_error: Optional[Exception] = None
+        self._pending: list[BaseMessage] = []  # evicted, not yet in the summary
+        self._pending_tokens: list[int] = []
+        self._pending_dropped = 0  # messages ever dropped from the front of _pending
+        self._window: list[BaseMessage] = []
+        self._window_tokens: list[int] = []  # per message, so eviction never recounts the window
+        self._window_total = 0
+        self._running = False
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        self._load()
+
+    # ---- BaseChatMessageHistory ---------------------------------------------------
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        with self._lock:
+            head = [SystemMessage(f"Summary of the earlier conversation: {self.summary}")] if self.summary else []
+            window = self._window
+            if self._window_total > self.max_tokens:
+                #only the latest turn is left and it alone is too big: shorten it in the
+                #prompt, the file (and the summarizer, later) keep the full text
+                window = _shorten(window, self.max_tokens, self.token_counter)
+            return head + self._unsummarized_tail() + window
+
+    def _unsummarized_tail(self) -> list[BaseMessage]:
+        #caller holds the lock: newest evicted turns that fit next to the window; if the
+        #summarizer falls behind, older ones wait for the summary instead of growing the prompt
+        room = self.max_tokens - self._window_total
+        start = len(self._pending)
+        while start and room - self._pending_tokens[start - 1] >= 0:
+            start -= 1
+            room -= self._pending_tokens[start]
+        tail = self._pending[start:]
+        while tail and not isinstance(tail[0], HumanMessage):
+            tail.pop(0)
+        return tail
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                for message in messages:
+                    f.write(_dumps([_CODES.get(message.type, "h"), message.text]) + "\n")
+            self._append(messages)
+            self._evict()
+
+    def clear(self) -> None:
+        self.wait()
+        with self._lock:
+            self.path.unlink(missing_ok=True)
+            self.summary, self._pending, self._pending_tokens = "", [], []
+            self._window, self._window_tokens, self._window_total = [], [], 0
+
+    # ---- window / summary ---------------------------------------------------------
+
+    def _append(self, messages: Sequence[BaseMessage]) -> None:
+        #caller holds the lock (or is __init__)
+        tokens = [self.token_counter([m]) for m in messages]
+        self._window.extend(messages)
+        self._window_tokens.extend(tokens)
+        self._window_total += sum(tokens)
+
+    def _evict(self) -> None:
+        #caller holds the lock; evict whole turns from the front, never the most recent one.
+        #Find the cut first, then move everything before it in one slice: linear in the
+        #window, also when a long file is reloaded
+        cut, total = 0, self._window_total
+        while total > self.max_tokens:
+            next_turn = next(
+                (i for i in range(cut + 1, len(self._window)) if isinstance(self._window[i], HumanMessage)), None
+            )
+            if next_turn is None:
+                break  # only the latest turn is left
+            total -= sum(self._window_tokens[cut:next_turn])
+            cut = next_turn
+        if cut:
+            self._pending.extend(self._window[:cut])
+            self._pending_tokens.extend(self._window_tokens[:cut])
+            del self._window[:cut], self._window_tokens[:cut]
+            self._window_total = total
+        if not self._pending:
+            return
+        if self.summarizer is None:
+            self._drop_pending(len(self._pending))
+        else:
+            self._cap_pending()
+            if not self._running:
+                self._running = True
+                self._idle.clear()
+                _EXECUTOR.submit(self._summarize)
+
+    def _cap_pending(self) -> None:
+        #caller holds the lock: a failing / slow summarizer must not let evicted turns pile up
+        limit, total = PENDING_LIMIT * self.max_tokens, sum(self._pending_tokens)
+        drop = 0
+        while total > limit and drop < len(self._pending):
+            total -= self._pending_tokens[drop]
+            drop += 1
+        while drop < len(self._pending) and not isinstance(self._pending[drop], HumanMessage):
+            drop += 1  # whole turns only
+        if drop:
+            self._drop_pending(drop)
+
+    def _drop_pending(self, count: int) -> None:
+        #caller holds the lock: forget the oldest evicted messages, also on disk
+        del self._pending[:count], self._pending_tokens[:count]
+        self._pending_dropped += count
+        self._rewrite()
+
+    def _summarize(self) -> None:
+        while True:
+            with self._lock:
+                batch = list(self._pending)
+                first = self._pending_dropped  # position of batch[0] among all pending messages ever
+                summary = self.summary
+                if not batch:
+                    self._running = False
+                    self._idle.set()
+                    return
+            try:
+                new_summary = self.summarizer.invoke({
+                    "summary": summary or "(none)",
+                    "lines": get_buffer_string(batch),
+                    "max_words": self.summary_words,
+                }).strip()
+            except Exception as e:  # keep the turns verbatim; retried on the next eviction
+                with self._lock:
+                    self.last_error = e
+                    self._running = False
+                    self._idle.set()
+                return
+            with self._lock:
+                self.summary = new_summary
+                #_cap_pending may have dropped part of the batch in the meantime
+                covered = max(first + len(batch) - self._pending_dropped, 0)
+                del self._pending[:covered], self._pending_tokens[:covered]
+                self._pending_dropped += covered
+                self._rewrite()
+
+    def _rewrite(self) -> None:
+        #caller holds the lock: file = summary line + every message not covered by it
+        uncovered = self._pending + self._window
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            if self.summary:
+                f.write(_dumps([_SUMMARY, self.summary]) + "\n")
+            for message in uncovered:
+                f.write(_dumps([_CODES.get(message.type, "h"), message.text]) + "\n")
+        tmp.replace(self.path)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        if records and records[0][0] == _SUMMARY:
+            self.summary = records.pop(0)[1]
+        self._append([_TYPES[code](text) for code, text in records])
+        with self._lock:
+            self._evict()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until no summary is being computed (for shutdown and demos)."""
+        return self._idle.wait(timeout)
+
+    def prompt_tokens(self) -> int:
+        return self.token_counter(self.messages)
+
+
+class ConversationStore:
+    """``get_session_history`` factory for RunnableWithMessageHistory; one history object per session."""
+
+    def __init__(self, directory: Path, summarizer_llm: Optional[BaseChatModel] = None,
+                 max_tokens: int = 1000, summary_words: int = 150,
+                 token_counter: Callable[[Sequence[BaseMessage]], int] = count_tokens_approximately):
+        self.directory = Path(directory)
+        self.summarizer = SUMMARY_PROMPT | summarizer_llm | StrOutputParser() if summarizer_llm else None
+        self.max_tokens = max_tokens
+        self.summary_words = summary_words
+        self.token_counter = token_counter
+        self._sessions: dict[str, RollingSummaryHistory] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> RollingSummaryHistory:
+        with self._lock:
+            if session_id not in self._sessions:
+                self._sessions[session_id] = RollingSummaryHistory(
+                    session_id, self.directory, self.summarizer, self.max_tokens,
+                    self.summary_words, self.token_counter,
+                )
+            return self._sessions[session_id]
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    from langchain_core.prompts import MessagesPlaceholder
+    from langchain_core.runnables import RunnableLambda
+    from langchain_core.runnables.history import RunnableWithMessageHistory
+
+    #offline stand-ins: a chatty "model" and a slow summarizer that keeps the last lines
+    def fake_model(prompt_value):
+        time.sleep(0.05)
+        return AIMessage("Here is a recipe idea: " + " ".join(["chickpeas, spinach, lemon"] * 8))
+
+    def slow_summary(inputs: dict) -> str:
+        time.sleep(0.3)  # a real summarizer call; the chat below does not wait for it
+        words = (inputs["summary"] + " " + inputs["lines"]).split()
+        return " ".join(words[-inputs["max_words"]:])
+
+    chat_prompt = ChatPromptTemplate.from_messages([
+        ("system", "You are an AI recipe assistant specializing in {dietary_preference} dishes."),
+        MessagesPlaceholder("history"),
+        ("human", "{recipe_request}"),
+    ])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ConversationStore(tmp, max_tokens=300, summary_words=60)
+        store.summarizer = RunnableLambda(slow_summary)
+        chain = RunnableWithMessageHistory(
+            chat_prompt | RunnableLambda(fake_model), store.get,
+            input_messages_key="recipe_request", history_messages_key="history",
+        )
+        config = {"configurable": {"session_id": "demo"}}
+        history = store.get("demo")
+        for turn in range(1, 31):
+            started = time.perf_counter()
+            chain.invoke({"dietary_preference": "Vegan", "recipe_request": f"Another quick snack, #{turn}?"},
+                         config=config)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if turn % 5 == 0:
+                print(f"turn {turn:>2}: history {history.prompt_tokens():>4} tokens, "
+                      f"{len(history.messages):>2} messages, turn took {elapsed_ms:5.1f} ms")
+        history.wait()
+        print(f"on disk: {history.path.stat().st_size} bytes, "
+              f"{len(history.path.read_text().splitlines())} lines after 30 turns")
+        print("reloaded:", len(RollingSummaryHistory("demo", tmp).messages), "messages")
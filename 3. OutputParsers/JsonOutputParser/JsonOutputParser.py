@@ -103,4 +103,24 @@ Final chain: prompt | model | parser
 They never output a real JSON object or any real data structure.
 
 When you parse LLM output with a JSON parser, it converts the LLM’s JSON text into a real programming-language object.
-'''
\ No newline at end of file
+'''
+
+'''
+Prose around the JSON (text1 above) + streaming:
+streaming_json_parser.py has StreamingJsonOutputParser, a drop-in JsonOutputParser that
+scans the text once, skips everything before the first { (top-level [ only with allow_arrays=True), yields partial dicts
+while streaming as each field completes, and ignores whatever follows the closing }.
+In `prompt | llm_model | parser` the model still generates to the end (the chain drains it);
+JsonStreamingChain closes the model stream as soon as the object is complete.
+
+from streaming_json_parser import JsonStreamingChain, StreamingJsonOutputParser
+parser = StreamingJsonOutputParser()
+parser.parse(text1)
+#{'name': 'Amey', 'age': 30, 'city': 'Pune'}
+
+for partial in (prompt | llm_model | parser).stream({}):
+    print(partial)
+
+for partial in JsonStreamingChain(prompt | llm_model, parser).stream({}):
+    print(partial)   # same partials, no tokens generated after the }
+'''
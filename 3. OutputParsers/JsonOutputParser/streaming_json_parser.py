@@ -0,0 +1,452 @@
+#Incremental (streaming) JSON parsing that tolerates prose around the JSON
+#
+#JsonOutputParser.py shows two problems with the stock JsonOutputParser:
+#   1. "Your result is ready:\n{ ... }\n\nThanks!"  -> OutputParserException (text before the "{")
+#   2. while streaming it re-parses the WHOLE accumulated text on every chunk, and
+#      it keeps reading the model stream until the very end.
+#
+#IncrementalJsonScanner reads the text once, chunk by chunk:
+#   - skips everything until the first "{" (prose, ```json fences, ...); a "[" in prose is
+#     usually a citation marker like "[1]", so top-level arrays are opt-in (allow_arrays=True)
+#   - builds the value as it goes and reports when a field/item has completed
+#   - marks itself `done` as soon as the top-level value closes; anything after
+#     that ("Thanks!") is never looked at
+#
+#StreamingJsonOutputParser plugs the scanner into JsonOutputParser, so
+#`prompt | llm | parser` streams partial dicts. It cannot stop the model though: a
+#Runnable that transforms a stream drains its input to the end for tracing, so the
+#model keeps generating (and billing) the trailing prose.
+#
+#JsonStreamingChain owns the model stream instead and closes it as soon as the JSON
+#value is complete:
+#   prompt | llm | parser                  -> partials, model runs to the end
+#   JsonStreamingChain(prompt | llm)       -> partials, model stream closed after "}"
+
+import json
+import re
+from typing import Any, AsyncIterator, Iterator, Optional, Union
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import BaseMessage
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import Generation
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import patch_config
+
+_START_OBJECT = re.compile(r"{")
+_START_ANY = re.compile(r"[{\[]")
+_STRING_STOP = re.compile(r'["\\]')
+_WHITESPACE = " \t\r\n"
+_LITERAL_START = "-0123456789tfn"
+_LITERAL_CHARS = frozenset("+-0123456789.eEtruefalsn")
+
+#parser states (what the innermost open container expects next)
+_KEY_OR_END = 0     # just after "{"
+_KEY = 1            # after "," in an object
+_COLON = 2          # after a key
+_VALUE = 3          # after ":" in an object / after "," in an array
+_VALUE_OR_END = 4   # just after "["
+_COMMA_OR_END = 5   # after a complete member / item
+
+
+def _copy(value: Any) -> Any:
+    #cheaper than copy.deepcopy for plain JSON data
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+class IncrementalJsonScanner:
+    """Single-pass scanner that finds and parses the first JSON object/array in a text stream.
+
+    Feed text with ``feed(chunk)``; it returns True when at least one field or item
+    was completed by that chunk. ``snapshot()`` returns a copy of the value built so
+    far, ``done`` turns True once the top-level value has closed.
+
+    Only an object is detected as the start of the value: a bare number or word in the
+    surrounding prose is not JSON we want, and neither is a citation like "[1]". With
+    ``allow_arrays=True`` a top-level array is accepted too.
+
+    With ``strict=False`` (default) a syntax error inside a candidate value (e.g. a
+    "{" that was part of the prose) throws the candidate away and the scan continues
+    with the next "{" -- but only until a field/item of the candidate has completed.
+    From then on the candidate may already have been streamed, so an error raises
+    OutputParserException, as it always does with ``strict=True``.
+    """
+
+    def __init__(self, strict: bool = False, allow_arrays: bool = False):
+        self.strict = strict
+        self._start = _START_ANY if allow_arrays else _START_OBJECT
+        self.consumed = 0  # characters read, including skipped prose
+        self._reset()
+
+    def _reset(self) -> None:
+        self.root: Any = None
+        self.done = False
+        self.committed = False  # a field/item completed: no more silent discards
+        self._stack: list[list] = []  # [container, state, pending_key]
+        self._token: Optional[list[str]] = None
+        self._token_is_string = False
+        self._escape = False
+
+    # ---- public -----------------------------------------------------------------
+
+    @property
+    def started(self) -> bool:
+        return self.root is not None
+
+    def snapshot(self) -> Any:
+        return _copy(self.root)
+
+    def feed(self, chunk: str) -> bool:
+        """Consume ``chunk``; return True if a field/item (or the whole value) completed."""
+        if self.done:
+            return False
+        completed = False
+        i, n = 0, len(chunk)
+        while i < n and not self.done:
+            if self._token is not None and self._token_is_string:
+                i, finished = self._scan_string(chunk, i)
+                completed |= finished
+                continue
+
+            ch = chunk[i]
+            if self._token is not None:  # number / true / false / null in progress
+                if ch in _LITERAL_CHARS:
+                    self._token.append(ch)
+                    i += 1
+                    continue
+                #delimiter reached: finish the literal, then look at `ch` again
+                completed |= self._finish_literal()
+                continue
+
+            if not self._stack:  # still in the prose before the JSON
+                match = self._start.search(chunk, i)
+                if match is None:
+                    i = n
+                    break
+                self._open(match.group())
+                i = match.end()
+                continue
+
+            if ch in _WHITESPACE:
+                i += 1
+                continue
+            completed |= self._step(ch)
+            i += 1
+
+        self.consumed += i
+        return completed
+
+    # ---- internals --------------------------------------------------------------
+
+    def _fail(self, reason: str) -> bool:
+        if self.strict or self.committed:
+            raise OutputParserException(f"Invalid json output: {reason}")
+        self._reset()
+        return False
+
+    def _open(self, bracket: str) -> None:
+        if bracket == "{":
+            container, state = {}, _KEY_OR_END
+        else:
+            container, state = [], _VALUE_OR_END
+        if self._stack:
+            self._attach(container)
+        else:
+            self.root = container
+        self._stack.append([container, state, None])
+
+    def _close(self) -> bool:
+        self.committed = True
+        self._stack.pop()
+        if not self._stack:
+            self.done = True
+        return True
+
+    def _attach(self, value: Any) -> None:
+        frame = self._stack[-1]
+        if isinstance(frame[0], dict):
+            frame[0][frame[2]] = value
+        else:
+            frame[0].append(value)
+        frame[1] = _COMMA_OR_END
+
+    def _start_value(self, ch: str) -> bool:
+        if ch == '"':
+            self._token, self._token_is_string = [], True
+        elif ch in "{[":
+            self._open(ch)
+        elif ch in _LITERAL_START:
+            self._token, self._token_is_string = [ch], False
+        else:
+            return self._fail(f"unexpected {ch!r}")
+        return False
+
+    def _step(self, ch: str) -> bool:
+        frame = self._stack[-1]
+        state = frame[1]
+        if isinstance(frame[0], dict):
+            if state in (_KEY_OR_END, _KEY):
+                if ch == '"':
+                    self._token, self._token_is_string = [], True
+                    return False
+                if ch == "}":  # also accepts a trailing comma
+                    return self._close()
+            elif state == _COLON:
+                if ch == ":":
+                    frame[1] = _VALUE
+                    return False
+            elif state == _VALUE:
+                return self._start_value(ch)
+            elif state == _COMMA_OR_END:
+                if ch == ",":
+                    frame[1] = _KEY
+                    return False
+                if ch == "}":
+                    return self._close()
+        else:
+            if state in (_VALUE_OR_END, _VALUE):
+                if ch == "]":
+                    return self._close()
+                return self._start_value(ch)
+            if state == _COMMA_OR_END:
+                if ch == ",":
+                    frame[1] = _VALUE
+                    return False
+                if ch == "]":
+                    return self._close()
+        return self._fail(f"unexpected {ch!r}")
+
+    def _scan_string(self, chunk: str, i: int) -> tuple[int, bool]:
+        n = len(chunk)
+        while i < n:
+            if self._escape:
+                self._token.append(chunk[i])
+                self._escape = False
+                i += 1
+                continue
+            match = _STRING_STOP.search(chunk, i)
+            if match is None:
+                self._token.append(chunk[i:])
+                return n, False
+            self._token.append(chunk[i:match.start()])
+            i = match.end()
+            if match.group() == "\\":
+                self._token.append("\\")
+                self._escape = True
+                continue
+            #closing quote
+            raw = "".join(self._token)
+            self._token = None
+            try:
+                value = json.loads(f'"{raw}"', strict=False)
+            except json.JSONDecodeError:
+                return i, self._fail("bad string escape")
+            frame = self._stack[-1]
+            if isinstance(frame[0], dict) and frame[1] in (_KEY_OR_END, _KEY):
+                frame[2] = value
+                frame[1] = _COLON
+                return i, False
+            self._attach(value)
+            self.committed = True
+            return i, True
+        return i, False
+
+    def _finish_literal(self) -> bool:
+        raw = "".join(self._token)
+        self._token = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return self._fail(f"bad literal {raw!r}")
+        self._attach(value)
+        self.committed = True
+        return True
+
+
+def _chunk_text(chunk: Union[str, BaseMessage]) -> str:
+    return chunk.text if isinstance(chunk, BaseMessage) else chunk
+
+
+class StreamingJsonOutputParser(JsonOutputParser):
+    """JsonOutputParser that finds the JSON anywhere in the text and parses it incrementally.
+
+    - ``parse("Your result is ready: {...} Thanks!")`` works.
+    - ``.stream()`` yields a new partial dict each time a field completes and ignores
+      everything after the top-level value (use JsonStreamingChain to also stop the model).
+    - ``allow_arrays=True`` also accepts a top-level array (off by default: "[1]" in
+      prose would be taken for the answer).
+    """
+
+    strict: bool = False
+    allow_arrays: bool = False
+
+    def _scanner(self) -> IncrementalJsonScanner:
+        return IncrementalJsonScanner(strict=self.strict, allow_arrays=self.allow_arrays)
+
+    def parse_result(self, result: list[Generation], *, partial: bool = False) -> Any:
+        text = result[0].text
+        scanner = self._scanner()
+        scanner.feed(text)
+        if scanner.done:
+            return scanner.root
+        if partial:
+            return scanner.snapshot() if scanner.started else None
+        if not scanner.started:
+            #no object/array at all -> let the stock parser try (bare JSON scalars)
+            return super().parse_result(result, partial=False)
+        raise OutputParserException(f"Invalid json output: {text}", llm_output=text)
+
+    def _partials(self, chunks: Iterator[Union[str, BaseMessage]]) -> Iterator[Any]:
+        #returns once the top-level value has closed, without pulling the next chunk
+        scanner = self._scanner()
+        prev = None
+        for chunk in chunks:
+            if scanner.feed(_chunk_text(chunk)):
+                parsed = scanner.snapshot()
+                if parsed != prev:  # e.g. a nested "}" completes nothing new
+                    yield self._diff(prev, parsed) if self.diff else parsed
+                    prev = parsed
+            if scanner.done:
+                return
+
+    async def _apartials(self, chunks: AsyncIterator[Union[str, BaseMessage]]) -> AsyncIterator[Any]:
+        scanner = self._scanner()
+        prev = None
+        async for chunk in chunks:
+            if scanner.feed(_chunk_text(chunk)):
+                parsed = scanner.snapshot()
+                if parsed != prev:
+                    yield self._diff(prev, parsed) if self.diff else parsed
+                    prev = parsed
+            if scanner.done:
+                return
+
+    def _transform(self, input: Iterator[Union[str, BaseMessage]]) -> Iterator[Any]:
+        #the caller drains `input` after this returns (see the header), trailing prose is just skipped
+        yield from self._partials(input)
+
+    async def _atransform(self, input: AsyncIterator[Union[str, BaseMessage]]) -> AsyncIterator[Any]:
+        async for partial in self._apartials(input):
+            yield partial
+
+    @property
+    def _type(self) -> str:
+        return "streaming_json_output_parser"
+
+
+async def _aiter_one(value: Any) -> AsyncIterator[Any]:
+    yield value
+
+
+class JsonStreamingChain(Runnable):
+    """``model | parser`` that closes the model stream once the JSON value is complete.
+
+    model:  any Runnable streaming text or message chunks (``llm``, ``prompt | llm``, ...)
+    parser: StreamingJsonOutputParser (default: a new one)
+
+    ``stream`` yields the parser's partials, ``invoke`` returns the complete value. Both
+    stop iterating the model after the closing bracket and close its stream, so the
+    provider stops generating the trailing prose.
+    """
+
+    def __init__(self, model: Runnable, parser: Optional[StreamingJsonOutputParser] = None):
+        self.model = model
+        self.parser = parser or StreamingJsonOutputParser()
+
+    def _model_stream(self, input: Any, run_manager, config: RunnableConfig):
+        return self.model.stream(input, patch_config(config, callbacks=run_manager.get_child("model")))
+
+    def _amodel_stream(self, input: Any, run_manager, config: RunnableConfig):
+        return self.model.astream(input, patch_config(config, callbacks=run_manager.get_child("model")))
+
+    def _invoke(self, input: Any, run_manager, config: RunnableConfig) -> Any:
+        scanner = self.parser._scanner()
+        pieces = []
+        chunks = self._model_stream(input, run_manager, config)
+        try:
+            for chunk in chunks:
+                pieces.append(_chunk_text(chunk))
+                scanner.feed(pieces[-1])
+                if scanner.done:
+                    return scanner.root
+        finally:
+            chunks.close()  # GeneratorExit runs down to the provider's HTTP stream
+        return self.parser.parse("".join(pieces))  # no complete value: same result/error as parse()
+
+    async def _ainvoke(self, input: Any, run_manager, config: RunnableConfig) -> Any:
+        scanner = self.parser._scanner()
+        pieces = []
+        chunks = self._amodel_stream(input, run_manager, config)
+        try:
+            async for chunk in chunks:
+                pieces.append(_chunk_text(chunk))
+                scanner.feed(pieces[-1])
+                if scanner.done:
+                    return scanner.root
+        finally:
+            await chunks.aclose()
+        return self.parser.parse("".join(pieces))
+
+    def _stream(self, inputs: Iterator[Any], run_manager, config: RunnableConfig) -> Iterator[Any]:
+        chunks = self._model_stream(next(inputs), run_manager, config)
+        try:
+            yield from self.parser._partials(chunks)
+        finally:
+            chunks.close()
+
+    async def _astream(self, inputs: AsyncIterator[Any], run_manager, config: RunnableConfig) -> AsyncIterator[Any]:
+        chunks = self._amodel_stream(await inputs.__anext__(), run_manager, config)
+        try:
+            async for partial in self.parser._apartials(chunks):
+                yield partial
+        finally:
+            await chunks.aclose()
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self._call_with_config(self._invoke, input, config)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self._acall_with_config(self._ainvoke, input, config)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        yield from self._transform_stream_with_config(iter([input]), self._stream, config)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async for partial in self._atransform_stream_with_config(_aiter_one(input), self._astream, config):
+            yield partial
+
+
+if __name__ == "__main__":
+    parser = StreamingJsonOutputParser()
+
+    text1 = """
+Your result is ready:
+{
+    "name": "Amey",
+    "age": 30,
+    "city": "Pune"
+}
+
+Thanks!
+"""
+    print(parser.parse(text1))
+    #{'name': 'Amey', 'age': 30, 'city': 'Pune'}
+
+    #simulate a token stream: partial dicts come out as soon as each field is complete
+    chunks = [text1[i:i + 7] for i in range(0, len(text1), 7)]
+    for partial in parser.transform(iter(chunks)):
+        print(partial)
+    #{'name': 'Amey'}
+    #{'name': 'Amey', 'age': 30}
+    #{'name': 'Amey', 'age': 30, 'city': 'Pune'}
+
+    #"[1]" is a citation, not the answer: top-level arrays are only taken with allow_arrays=True
+    text2 = 'According to the paper [1], the answer is:\n{"name": "Amey", "age": 30}'
+    print(parser.parse(text2))
+    #{'name': 'Amey', 'age': 30}
+    print(list(parser.transform(iter([text2[i:i + 7] for i in range(0, len(text2), 7)])))[-1])
+    #{'name': 'Amey', 'age': 30}
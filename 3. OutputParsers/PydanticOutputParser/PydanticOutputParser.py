@@ -105,3 +105,18 @@ class Person(BaseModel):
     }
 
 '''
+
+'''
+Fixing these locally instead of asking the model again:
+../output_repair.py has RepairingPydanticOutputParser. It first tries the normal parse, then
+repairs the text locally (no JSON -> key: value prose, single quotes, bare keys, trailing
+commas, truncated output, "twenty" -> 20, wrong key case, ...) and only calls the model
+when that fails and an llm was given.
+
+parser = RepairingPydanticOutputParser(pydantic_object=Person, llm=llm_model)
+parser.parse_with_repairs('{"name": "Rahul", "age": "twenty", "city": "Pune"}')
+#(Person(name='Rahul', age=20, city='Pune'), ["age: number words ('twenty' -> 20)"])
+
+Case 2 (missing required field) still fails locally: a missing city cannot be invented,
+so that one goes to the model.
+'''
@@ -0,0 +1,52 @@
+#Per-call overhead: stock PydanticOutputParser vs CachedPydanticOutputParser
+#
+#   python "3. OutputParsers/PydanticOutputParser/bench_cached_parser.py"
+#
+#No model calls: it times only the parser work that happens around every LLM call
+#in Simple RAG.py (format instructions + parse), and a 1000-completion bulk job.
+
+import json
+import timeit
+
+from langchain_core.output_parsers import PydanticOutputParser
+from pydantic import BaseModel
+
+from cached_pydantic_parser import CachedPydanticOutputParser
+
+
+class Answer(BaseModel):
+    summary: str
+    sources: list[str]
+
+
+COMPLETION = json.dumps({
+    "summary": "The paper introduces the Transformer, an attention-only sequence model.",
+    "sources": ["Attention is all you need - Research paper.pdf", "https://docs.langchain.com/"],
+})
+BULK = [COMPLETION] * 1000
+
+
+def _per_call_us(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    stock = PydanticOutputParser(pydantic_object=Answer)
+    cached = CachedPydanticOutputParser(pydantic_object=Answer)
+
+    rows = [
+        ("get_format_instructions", _per_call_us(stock.get_format_instructions, 2000),
+         _per_call_us(cached.get_format_instructions, 2000)),
+        ("parse (clean JSON)", _per_call_us(lambda: stock.parse(COMPLETION), 2000),
+         _per_call_us(lambda: cached.parse(COMPLETION), 2000)),
+        ("1000 completions", _per_call_us(lambda: [stock.parse(t) for t in BULK], 3),
+         _per_call_us(lambda: cached.parse_batch(BULK), 3)),
+    ]
+
+    print(f"{'operation':<26}{'stock (us)':>14}{'cached (us)':>14}{'speedup':>10}")
+    for name, before, after in rows:
+        print(f"{name:<26}{before:>14.2f}{after:>14.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
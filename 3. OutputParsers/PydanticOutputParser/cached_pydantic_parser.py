@@ -0,0 +1,105 @@
+#PydanticOutputParser with cached schema artifacts + batch parsing
+#
+#Simple RAG.py passes   "format_instructions": lambda x: parser.get_format_instructions()
+#so the JSON schema of Answer is rebuilt (model_json_schema + json.dumps) on EVERY call.
+#Each parse also goes text -> markdown/partial-JSON helpers -> dict -> model_validate.
+#
+#CachedPydanticOutputParser builds everything that only depends on the model class ONCE
+#per class and reuses it from every parser instance:
+#   - format instructions (and the JSON schema they are made from)
+#and parses clean JSON completions with model_validate_json (one pass in pydantic-core),
+#falling back to the stock path for fenced / chatty / partial output.
+#
+#parse_batch() parses a list of completions for bulk-extraction jobs. Every completion is
+#validated on its own: gluing them into one JSON array would let a string left open in
+#one completion swallow the next one.
+
+from functools import lru_cache
+from typing import Any, Sequence
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.outputs import Generation
+from pydantic import BaseModel, ValidationError
+
+
+class _SchemaArtifacts:
+    """Everything derived from a model class that never changes."""
+
+    def __init__(self, model: type[BaseModel], format_instructions: str):
+        self.model = model
+        self.schema = model.model_json_schema()
+        self.format_instructions = format_instructions
+
+
+@lru_cache(maxsize=None)
+def _artifacts_for(model: type[BaseModel]) -> _SchemaArtifacts:
+    #the stock implementation is the source of truth for the instruction text
+    instructions = PydanticOutputParser(pydantic_object=model).get_format_instructions()
+    return _SchemaArtifacts(model, instructions)
+
+
+def _is_plain_json_object(text: str) -> bool:
+    return text.startswith("{") and text.endswith("}")
+
+
+class CachedPydanticOutputParser(PydanticOutputParser):
+    """Drop-in PydanticOutputParser that builds schema artifacts once per model class."""
+
+    @property
+    def artifacts(self) -> _SchemaArtifacts:
+        return _artifacts_for(self.pydantic_object)
+
+    def get_format_instructions(self) -> str:
+        return self.artifacts.format_instructions
+
+    def parse_result(self, result: list[Generation], *, partial: bool = False) -> Any:
+        if not partial:
+            text = result[0].text.strip()
+            if _is_plain_json_object(text):
+                try:
+                    return self.pydantic_object.model_validate_json(text)
+                except ValidationError:
+                    pass  # let the stock path produce the usual error / handle odd input
+        return super().parse_result(result, partial=partial)
+
+    def parse_batch(self, texts: Sequence[str], *, return_exceptions: bool = False) -> list[Any]:
+        """Parse many completions, each exactly like ``parse`` would.
+
+        With ``return_exceptions=True`` a bad completion yields its
+        OutputParserException in the result list instead of failing the batch.
+        """
+        results = []
+        for text in texts:
+            try:
+                results.append(self.parse(text))
+            except OutputParserException as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    @property
+    def _type(self) -> str:
+        return "cached_pydantic"
+
+
+if __name__ == "__main__":
+    class Answer(BaseModel):
+        summary: str
+        sources: list[str]
+
+    parser = CachedPydanticOutputParser(pydantic_object=Answer)
+
+    #same string object every time, built once for the Answer class
+    assert parser.get_format_instructions() is CachedPydanticOutputParser(pydantic_object=Answer).get_format_instructions()
+
+    print(parser.parse('{"summary": "Transformers", "sources": ["paper.pdf"]}'))
+
+    completions = [
+        '{"summary": "a", "sources": []}',
+        '```json\n{"summary": "b", "sources": ["x"]}\n```',
+        '{"summary": "c"}',
+    ]
+    print(parser.parse_batch(completions, return_exceptions=True))
+    #[Answer(summary='a', sources=[]), Answer(summary='b', sources=['x']), OutputParserException(...)]
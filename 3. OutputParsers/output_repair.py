@@ -0,0 +1,562 @@
+#Local, deterministic repair of malformed structured output
+#
+#PydanticOutputParser.py / JsonOutputParser.py show the usual ways a model breaks the format:
+#   name: Amey, age: 30, city: Pune                      -> no JSON at all
+#   {'name': 'Amey', age: 30, 'city': 'Pune',}           -> single quotes, bare key, trailing comma
+#   {"name": "Rahul", "age": "twenty", "city": "Pune"}   -> number written as words
+#   {"name": "Rahul", "age": 25, "city": "Pune"          -> truncated output (missing "}")
+#The usual fix is another round trip to the model (OutputFixingParser / retry), which
+#doubles latency. Most of these can be fixed locally in microseconds:
+#
+#   completion --> stock parser ok? --> done
+#                        | no
+#                        v
+#                  local repair (syntax + schema coercion) ok? --> done (+ list of repairs)
+#                        | no
+#                        v
+#                  ask the model to fix it (only if an llm was given)
+
+import json
+import logging
+import re
+import types
+from typing import Any, Optional, Union, get_args, get_origin
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.output_parsers import JsonOutputParser, PydanticOutputParser, StrOutputParser
+from langchain_core.outputs import Generation
+from langchain_core.prompts import PromptTemplate
+from langchain_core.utils.json import parse_json_markdown
+from pydantic import BaseModel, Field, ValidationError
+
+logger = logging.getLogger(__name__)
+
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_KEY_VALUE = re.compile(
+    r"""([A-Za-z_][\w \-]*?)[ \t]*[:=][ \t]*("[^"]*"|'[^']*'|[^,;\n]*)"""
+)
+_LEADING_NUMBER = re.compile(r"^\s*(-?\d+(?:\.\d+)?)")
+_LITERALS = {
+    "true": (True, False), "false": (False, False), "null": (None, False),
+    "True": (True, True), "False": (False, True), "None": (None, True),
+}
+
+_UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+_TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+    "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+_SCALES = {"hundred": 100, "thousand": 1_000, "million": 1_000_000}
+
+NAIVE_FIX_PROMPT = PromptTemplate.from_template(
+    "Instructions:\n--------------\n{instructions}\n--------------\n"
+    "Completion:\n--------------\n{completion}\n--------------\n\n"
+    "Above, the Completion did not satisfy the constraints given in the Instructions.\n"
+    "Error:\n--------------\n{error}\n--------------\n\n"
+    "Please try again. Please only respond with an answer that satisfies the "
+    "constraints laid out in the Instructions:"
+)
+
+
+def words_to_number(text: str) -> Optional[int]:
+    """'twenty-five' -> 25, 'one hundred and five' -> 105; None if not a number phrase."""
+    words = text.lower().replace("-", " ").replace(",", " ").split()
+    if not words:
+        return None
+    total = current = 0
+    if all(word == "and" for word in words):
+        return None  # "and" alone is not zero
+    for word in words:
+        if word == "and":
+            continue
+        if word in _UNITS:
+            current += _UNITS[word]
+        elif word in _TENS:
+            current += _TENS[word]
+        elif word == "hundred":
+            current = (current or 1) * 100
+        elif word in _SCALES:
+            total += (current or 1) * _SCALES[word]
+            current = 0
+        else:
+            return None
+    return total + current
+
+
+# ---- syntax repair ----------------------------------------------------------------
+
+
+class _LenientJson:
+    """Tiny recursive-descent JSON reader that accepts the common model mistakes."""
+
+    def __init__(self, text: str, repairs: list[str]):
+        self.s = text
+        self.i = 0
+        self.n = len(text)
+        self.repairs = repairs
+        #the last value ran into the end of the text: a string without its closing quote,
+        #a bare number/word (3 may be the start of 30), an array without "]"
+        self.truncated = False
+
+    def note(self, repair: str) -> None:
+        if repair not in self.repairs:
+            self.repairs.append(repair)
+
+    def skip_ws(self) -> None:
+        while self.i < self.n and self.s[self.i].isspace():
+            self.i += 1
+
+    def value(self, stops: str) -> Any:
+        self.skip_ws()
+        if self.i >= self.n:
+            raise ValueError("unexpected end of output")
+        ch = self.s[self.i]
+        if ch == "{":
+            return self.object()
+        if ch == "[":
+            return self.array()
+        if ch in "\"'":
+            return self.string()
+        return self.bare_value(stops)
+
+    def object(self) -> dict:
+        self.i += 1
+        result = {}
+        while True:
+            self.skip_ws()
+            if self.i >= self.n:
+                self.note("closed truncated object")
+                return result
+            ch = self.s[self.i]
+            if ch == "}":
+                self.i += 1
+                return result
+            if ch == ",":
+                self.i += 1
+                self.skip_ws()
+                if self.i < self.n and self.s[self.i] == "}":
+                    self.note("removed trailing comma")
+                continue
+            key = self.string() if ch in "\"'" else self.bare_key()
+            self.skip_ws()
+            if self.i >= self.n:
+                self.note("closed truncated object")
+                return result
+            if self.s[self.i] not in ":=":
+                raise ValueError(f"expected ':' after key {key!r}")
+            self.i += 1
+            self.skip_ws()
+            if self.i >= self.n:
+                self.note("closed truncated object")
+                return result
+            value = self.value(",}\n")
+            if self.truncated:
+                #"city": "Pu / "age": 3 / "tags": ["a", "b  -> not a value we can trust:
+                #drop the member, let validation decide
+                self.truncated = False
+                self.note(f"dropped truncated member ({key!r})")
+                return result
+            result[key] = value
+            self._after_member("}")
+
+    def array(self) -> list:
+        self.i += 1
+        result = []
+        while True:
+            self.skip_ws()
+            if self.i >= self.n:
+                #more items may have followed: the list as a whole is cut off
+                self.truncated = True
+                return result
+            ch = self.s[self.i]
+            if ch == "]":
+                self.i += 1
+                return result
+            if ch == "}":  # "[1, 2}" -> leave the "}" for the enclosing object
+                self.note("closed mismatched bracket")
+                return result
+            if ch == ",":
+                self.i += 1
+                self.skip_ws()
+                if self.i < self.n and self.s[self.i] == "]":
+                    self.note("removed trailing comma")
+                continue
+            value = self.value(",]\n")
+            if self.truncated:
+                return result  # still truncated: the enclosing object drops the whole list
+            result.append(value)
+            self._after_member("]")
+
+    def _after_member(self, closer: str) -> None:
+        self.skip_ws()
+        if self.i >= self.n or self.s[self.i] in "," + closer:
+            return
+        if self.s[self.i] in "\"'{[" or self.s[self.i].isalnum():
+            self.note("inserted missing comma")
+            return
+        raise ValueError(f"unexpected {self.s[self.i]!r} at {self.i}")
+
+    def string(self) -> str:
+        quote = self.s[self.i]
+        if quote == "'":
+            self.note("converted single-quoted strings")
+        self.i += 1
+        chars = []
+        while self.i < self.n:
+            ch = self.s[self.i]
+            if ch == "\\" and self.i + 1 < self.n:
+                chars.append(self.s[self.i:self.i + 2])
+                self.i += 2
+                continue
+            if ch == quote:
+                self.i += 1
+                break
+            chars.append('\\"' if ch == '"' else ch)
+            self.i += 1
+        else:
+            self.truncated = True
+        raw = "".join(chars).replace("\\'", "'")
+        try:
+            return json.loads(f'"{raw}"', strict=False)
+        except json.JSONDecodeError:
+            return raw
+
+    def bare_key(self) -> str:
+        start = self.i
+        while self.i < self.n and self.s[self.i] not in ":={},\n":
+            self.i += 1
+        key = self.s[start:self.i].strip()
+        if not key:
+            raise ValueError(f"expected a key at {start}")
+        self.note("quoted bare keys")
+        return key
+
+    def bare_value(self, stops: str) -> Any:
+        start = self.i
+        while self.i < self.n and self.s[self.i] not in stops:
+            self.i += 1
+        token = self.s[start:self.i].strip()
+        if not token:
+            raise ValueError(f"expected a value at {start}")
+        if self.i >= self.n:
+            self.truncated = True
+        return _bare_token(token, self.note)
+
+
+def _bare_token(token: str, note) -> Any:
+    if token in _LITERALS:
+        value, pythonic = _LITERALS[token]
+        if pythonic:
+            note("converted Python literals")
+        return value
+    try:
+        return json.loads(token)
+    except json.JSONDecodeError:
+        note("quoted bare values")
+        return token
+
+
+def _read_at(cleaned: str, start: int) -> tuple[Any, list[str], int]:
+    repairs = ["stripped prose before JSON"] if cleaned[:start].strip() else []
+    reader = _LenientJson(cleaned[start:], repairs)
+    value = reader.value("")
+    if reader.truncated:
+        raise ValueError("output ends inside an unclosed array")
+    end = start + reader.i
+    if cleaned[end:].strip():
+        reader.note("stripped prose after JSON")
+    return value, repairs, end
+
+
+def _first_json_value(cleaned: str, starts: list[int]) -> tuple[Any, list[str]]:
+    #"According to the paper [1], the answer is: {...}": a bracket in the prose is not the
+    #answer. Take the first object; an array only if it holds an object or nothing else parses.
+    fallback, error = None, None
+    position = 0
+    for start in starts:
+        if start < position:
+            continue  # inside a value that was already read
+        try:
+            value, repairs, end = _read_at(cleaned, start)
+        except ValueError as e:
+            error = error or e
+            continue
+        if isinstance(value, dict) or (isinstance(value, list) and "{" in cleaned[start:end]):
+            return value, repairs
+        fallback = fallback or (value, repairs)
+        position = end
+    if fallback is not None:
+        return fallback
+    raise error
+
+
+def _strict_json(text: str) -> Any:
+    #the stock parsers go through parse_partial_json, which closes a cut-off string and
+    #returns "city": "Pu as data; only complete JSON may skip the repair step
+    return parse_json_markdown(text, parser=lambda s: json.loads(s, strict=False))
+
+
+def repair_json_text(text: str, allow_prose: bool = True) -> tuple[Any, list[str]]:
+    """Best-effort JSON value from ``text`` plus the list of repairs that were needed.
+
+    ``allow_prose`` reads "name: Amey, age: 30" as an object when there is no JSON at all.
+    Only safe with a schema to check the result ("The answer is: no" is prose too).
+    Raises ValueError when nothing usable can be recovered.
+    """
+    repairs: list[str] = []
+    cleaned = _FENCE.sub("", text).strip()
+    try:
+        return json.loads(cleaned), repairs
+    except json.JSONDecodeError:
+        pass
+
+    starts = [m.start() for m in re.finditer(r"[{\[]", cleaned)]
+    if starts:
+        return _first_json_value(cleaned, starts)
+
+    if not allow_prose:
+        raise ValueError("no JSON object found")
+
+    #no braces at all: "name: Amey, age: 30, city: Pune"
+    pairs = {}
+    for key, raw in _KEY_VALUE.findall(cleaned):
+        raw = raw.strip()
+        if not raw:
+            continue  # "Here is some JSON:" style lead-in
+        if raw[0] in "\"'" and raw[-1] == raw[0]:
+            value = raw[1:-1]
+        else:
+            value = _bare_token(raw, lambda _: None)
+        pairs[key.strip()] = value
+    if not pairs:
+        raise ValueError("no JSON object or key: value pairs found")
+    repairs.append("parsed key-value prose")
+    return pairs, repairs
+
+
+# ---- schema coercion --------------------------------------------------------------
+
+
+def _normalize_key(key: str) -> str:
+    return re.sub(r"[\s\-_]+", "", key).lower()
+
+
+def _coerce_value(value: Any, annotation: Any, repairs: list[str], path: str) -> Any:
+    origin = get_origin(annotation)
+    args = [a for a in get_args(annotation) if a is not type(None)]
+    if origin is Union or origin is types.UnionType:
+        if len(args) == 1:  # Optional[X] / X | None
+            return _coerce_value(value, args[0], repairs, path)
+        return value
+
+    if annotation in (int, float) and isinstance(value, str):
+        try:
+            float(value)
+            return value  # pydantic handles "30"
+        except ValueError:
+            pass
+        number = words_to_number(value)
+        if number is not None:
+            repairs.append(f"{path}: number words ({value!r} -> {number})")
+            return number
+        match = _LEADING_NUMBER.match(value)
+        if match:
+            repairs.append(f"{path}: extracted number ({value!r})")
+            return match.group(1)
+        return value
+
+    if annotation is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+        repairs.append(f"{path}: number -> string")
+        return str(value)
+
+    if origin in (list, set, tuple):
+        item_type = args[0] if args else Any
+        if isinstance(value, str):
+            repairs.append(f"{path}: split string into list")
+            value = [part.strip() for part in value.split(",") if part.strip()]
+        elif not isinstance(value, list):
+            repairs.append(f"{path}: wrapped value in list")
+            value = [value]
+        return [_coerce_value(v, item_type, repairs, f"{path}[{i}]") for i, v in enumerate(value)]
+
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return coerce_to_schema(value, annotation, repairs, path)
+    return value
+
+
+def coerce_to_schema(data: Any, model: type[BaseModel], repairs: list[str], path: str = "") -> Any:
+    """Map keys/values of ``data`` onto ``model``'s fields, appending to ``repairs``."""
+    if not isinstance(data, dict):
+        return data
+    by_normalized = {_normalize_key(k): k for k in data}
+    result = {}
+    used = set()
+    for name, field in model.model_fields.items():
+        field_path = f"{path}.{name}" if path else name
+        key = next((k for k in (name, field.alias) if k and k in data), None)
+        if key is None:
+            key = by_normalized.get(_normalize_key(name))
+            if key is not None:
+                repairs.append(f"{field_path}: renamed key ({key!r})")
+        if key is None:
+            if field.is_required() and type(None) in get_args(field.annotation):
+                repairs.append(f"{field_path}: filled missing optional field with null")
+                result[name] = None
+            continue  # defaults are applied by pydantic, required ones fail validation
+        used.add(key)
+        result[field.alias or name] = _coerce_value(data[key], field.annotation, repairs, field_path)
+
+    extra = [k for k in data if k not in used]
+    if model.model_config.get("extra") == "forbid":
+        if extra:
+            repairs.append(f"{path or model.__name__}: dropped unknown keys ({extra})")
+    else:
+        result.update({k: data[k] for k in extra})
+    return result
+
+
+# ---- parsers ----------------------------------------------------------------------
+
+
+class RepairingJsonOutputParser(JsonOutputParser):
+    """JsonOutputParser that repairs malformed JSON locally before giving up.
+
+    Without a schema it only repairs JSON syntax; "key: value" prose is rejected.
+    """
+
+    def parse_with_repairs(self, text: str) -> tuple[Any, list[str]]:
+        try:
+            return _strict_json(text), []
+        except ValueError:
+            pass
+        try:
+            return repair_json_text(text, allow_prose=False)
+        except ValueError:
+            raise OutputParserException(f"Invalid json output: {text}", llm_output=text) from None
+
+    def parse_result(self, result: list[Generation], *, partial: bool = False) -> Any:
+        if partial:
+            return super().parse_result(result, partial=True)
+        value, repairs = self.parse_with_repairs(result[0].text)
+        if repairs:
+            logger.info("repaired JSON output locally: %s", repairs)
+        return value
+
+    @property
+    def _type(self) -> str:
+        return "repairing_json_output_parser"
+
+
+class RepairingPydanticOutputParser(PydanticOutputParser):
+    """PydanticOutputParser with a local repair step before (optional) model escalation.
+
+    llm: model used to fix the completion only when local repair fails. Leave it as
+         None to fail fast with OutputParserException instead.
+
+    ``repair_counts`` counts how often each kind of repair was needed, which tells you
+    what to fix in the prompt.
+    """
+
+    llm: Optional[BaseLanguageModel] = None
+    repair_counts: dict[str, int] = Field(default_factory=dict)
+
+    def _count(self, repairs: list[str]) -> None:
+        for repair in repairs:
+            kind = repair.split(": ", 1)[-1].split(" (")[0]
+            self.repair_counts[kind] = self.repair_counts.get(kind, 0) + 1
+
+    def _repair_locally(self, text: str) -> tuple[BaseModel, list[str]]:
+        value, repairs = repair_json_text(text)
+        value = coerce_to_schema(value, self.pydantic_object, repairs)
+        try:
+            return self.pydantic_object.model_validate(value), repairs
+        except ValidationError as e:
+            raise ValueError(str(e)) from e
+
+    def _parse_locally(self, text: str) -> tuple[BaseModel, list[str]]:
+        try:
+            _strict_json(text)
+        except ValueError:
+            error = OutputParserException(f"Invalid json output: {text}", llm_output=text)
+        else:
+            try:
+                return super().parse_result([Generation(text=text)]), []
+            except OutputParserException as e:
+                error = e
+        try:
+            return self._repair_locally(text)
+        except ValueError as repair_error:
+            raise OutputParserException(
+                f"{error} (local repair failed: {repair_error})", llm_output=text
+            ) from repair_error
+
+    def parse_with_repairs(self, text: str) -> tuple[BaseModel, list[str]]:
+        """Return (model instance, repairs applied); raises OutputParserException if hopeless."""
+        try:
+            parsed, repairs = self._parse_locally(text)
+        except OutputParserException as e:
+            if self.llm is None:
+                raise
+            fixer = NAIVE_FIX_PROMPT | self.llm | StrOutputParser()
+            fixed = fixer.invoke({
+                "instructions": self.get_format_instructions(),
+                "completion": text,
+                "error": repr(e),
+            })
+            parsed, repairs = self._parse_locally(fixed)
+            repairs = ["llm fix"] + repairs
+        self._count(repairs)
+        return parsed, repairs
+
+    def parse_result(self, result: list[Generation], *, partial: bool = False) -> Any:
+        if partial:
+            return super().parse_result(result, partial=True)
+        parsed, repairs = self.parse_with_repairs(result[0].text)
+        if repairs:
+            logger.info("repaired %s output: %s", self.pydantic_object.__name__, repairs)
+        return parsed
+
+    @property
+    def _type(self) -> str:
+        return "repairing_pydantic_output_parser"
+
+
+if __name__ == "__main__":
+    class Person(BaseModel):
+        name: str
+        age: int
+        city: str
+
+    parser = RepairingPydanticOutputParser(pydantic_object=Person)
+
+    for text in [
+        "Here is some JSON:\nname: Amey, age: 30, city: Pune",
+        "{'name': 'Amey', age: 30, 'city': 'Pune',}",
+        '{"name": "Rahul", "age": "twenty", "city": "Pune"}',
+        'Your result is ready:\n{"Name": "Rahul", "age": 25, "city": "Pune"',
+        'According to the paper [1], the answer is:\n{"name": "Amey", "age": 30, "city": "Pune"}',
+    ]:
+        print(parser.parse_with_repairs(text))
+    #(Person(name='Amey', age=30, city='Pune'), ['parsed key-value prose'])
+    #(Person(name='Amey', age=30, city='Pune'), ['converted single-quoted strings', 'quoted bare keys', 'removed trailing comma'])
+    #(Person(name='Rahul', age=20, city='Pune'), ["age: number words ('twenty' -> 20)"])
+    #(Person(name='Rahul', age=25, city='Pune'), ['stripped prose before JSON', 'closed truncated object', "name: renamed key ('Name')"])
+    #(Person(name='Amey', age=30, city='Pune'), ['stripped prose before JSON'])
+
+    print(parser.repair_counts)
+
+    #missing required field -> local repair cannot invent it -> OutputParserException,
+    #or a model call if RepairingPydanticOutputParser(pydantic_object=Person, llm=ChatOpenAI())
+    #same for a value cut off at the end: "city": "Pu / "age": 3 are dropped, not taken as data
+    for text in ['{"name": "Rahul", "age": 25}', '{"name": "Rahul", "age": 25, "city": "Pu',
+                 '{"name": "Rahul", "city": "Pune", "age": 3']:
+        try:
+            parser.parse(text)
+        except OutputParserException as e:
+            print(type(e).__name__)
@@ -65,6 +65,10 @@ class Answer(BaseModel):
 
 parser = PydanticOutputParser(pydantic_object=Answer)
 
+#build the format instructions (JSON schema of Answer) once, not on every query
+#(see "3. OutputParsers/PydanticOutputParser/cached_pydantic_parser.py")
+prompt = prompt.partial(format_instructions=parser.get_format_instructions())
+
 # 7. LLM + FINAL RAG CHAIN
 
 from langchain_openai import ChatOpenAI
@@ -74,14 +78,22 @@ llm = ChatOpenAI()
 
 rag_chain = (
     {"context": retriever,
-     "question": RunnablePassthrough(),
-     "format_instructions": lambda x : parser.get_format_instructions()}
+     "question": RunnablePassthrough()}
     | prompt
     | llm
     | parser
 )
 
 # 8. RUN QUERY
-
-result = rag_chain.invoke("What is the documemt about")
+#profiling (optional): per-stage latency/tokens, see "5. Chains/pipeline_tracing.py".
+#Uncomment the three lines below to trace this query into rag_trace.json / rag_trace.prom
+#("5. Chains" is not an importable package name, so the folder goes on sys.path).
+from contextlib import nullcontext
+tracing = nullcontext()
+#import sys; from pathlib import Path; sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "5. Chains"))
+#from pipeline_tracing import trace_pipeline
+#tracing = trace_pipeline("rag_trace.json", prometheus_path="rag_trace.prom")
+
+with tracing:
+    result = rag_chain.invoke("What is the documemt about")
 print(result)
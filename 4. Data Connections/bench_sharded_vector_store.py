@@ -0,0 +1,75 @@
+#Queries/sec vs. shard count for ShardedIndex on a synthetic corpus
+#
+#   python "4. Data Connections/bench_sharded_vector_store.py" --vectors 1000000 --shards 1 2 4 8
+#
+#Vectors are random (seeded) unit vectors; no embeddings API is called. Each shard
+#is one process with one BLAS thread, so throughput should grow with the shard count
+#up to the number of physical cores.
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from sharded_vector_store import ShardedIndex, write_shards
+
+
+def synthetic_corpus(count: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((count, dim), dtype=np.float32)
+
+
+def measure(index: ShardedIndex, queries: np.ndarray, k: int, batch: int, duration: float) -> float:
+    index.search_batch(queries[:batch], k)  # warm up: fault the mmapped pages in
+    done = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        offset = (done // batch * batch) % (len(queries) - batch)
+        index.search_batch(queries[offset:offset + batch], k)
+        done += batch
+    return done / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=16, help="queries per fan-out")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per shard count")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    args = parser.parse_args()
+
+    vectors = synthetic_corpus(args.vectors, args.dim)
+    ids = [f"doc-{i}" for i in range(args.vectors)]
+    queries = synthetic_corpus(max(args.batch * 64, 1024), args.dim, seed=1)
+    print(f"{args.vectors:,} x {args.dim} vectors, k={args.k}, batch={args.batch}, cpus={os.cpu_count()}")
+
+    results = []
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_shards in args.shards:
+            directory = Path(tmp) / f"shards_{n_shards}"
+            write_shards(directory, ids, vectors, n_shards)
+            with ShardedIndex(directory) as index:
+                top_ids = [[hit[1] for hit in hits] for hits in index.search_batch(queries[:8], args.k)]
+                if reference is None:
+                    reference = top_ids
+                elif top_ids != reference:
+                    raise AssertionError(f"{n_shards} shards returned different top-k than {args.shards[0]}")
+                qps = measure(index, queries, args.k, args.batch, args.duration)
+            results.append({"shards": n_shards, "queries_per_sec": round(qps, 1)})
+            print(f"shards={n_shards:<3} {qps:>10.1f} queries/s")
+
+    if args.output:
+        args.output.write_text(json.dumps({"config": vars(args) | {"output": str(args.output)},
+                                           "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#Offline stand-ins for OpenAIEmbeddings / ChatOpenAI
+#
+#Used by the load generator in rag_server.py and by rag_benchmark.py so the pipeline can
+#be exercised (and timed) without API keys or network. Both are deterministic and sleep
+#to imitate a remote call:
+#   embeddings:  latency per call + latency per text + tokens_per_second over all texts
+#   chat model:  latency (time to first token) + output tokens / tokens_per_second,
+#                streamed token by token, with usage_metadata like the real providers
+
+import asyncio
+import json
+import math
+import re
+import time
+import zlib
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_WORD = re.compile(r"\w+")
+_TOKEN = re.compile(r"\w+|[^\w\s]|\s+")
+
+
+def count_tokens(text: str) -> int:
+    #words + punctuation: close enough to a BPE count for timing purposes
+    return len(_WORD.findall(text)) + len(re.findall(r"[^\w\s]", text))
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashing bag-of-words embeddings: texts sharing words get similar vectors.
+
+    latency:           seconds per embed call (one HTTP round trip)
+    latency_per_text:  extra seconds per text in the call
+    tokens_per_second: provider throughput over all tokens in the call (0 = unlimited)
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0, latency_per_text: float = 0.0,
+                 tokens_per_second: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self.tokens_per_second = tokens_per_second
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.size
+        for word in _WORD.findall(text.lower()):
+            vector[zlib.crc32(word.encode()) % self.size] += 1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def _delay(self, texts: list[str]) -> float:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        delay = self.latency + self.latency_per_text * len(texts)
+        if self.tokens_per_second:
+            delay += sum(count_tokens(t) for t in texts) / self.tokens_per_second
+        return delay
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self._delay(texts))
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(self._delay(texts))
+        return [self._embed(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def _default_answer(messages: list[BaseMessage]) -> str:
+    #valid JSON for the Answer model used in Simple RAG.py
+    prompt = messages[-1].text if messages else ""
+    question = prompt.rsplit("Question:", 1)[-1].strip()
+    return json.dumps({"summary": f"Fake answer to: {question}", "sources": []})
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers ``respond(messages)`` after a simulated generation time.
+
+    latency:           seconds before the first token
+    tokens_per_second: output rate; 0 = the whole answer arrives with the first token
+    """
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    respond: Callable[[list[BaseMessage]], str] = _default_answer
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _usage(self, messages: list[BaseMessage], text: str) -> dict:
+        input_tokens = sum(count_tokens(m.text) for m in messages)
+        output_tokens = count_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generation_time(self, text: str) -> float:
+        if not self.tokens_per_second:
+            return self.latency
+        return self.latency + count_tokens(text) / self.tokens_per_second
+
+    def _answer(self, messages: list[BaseMessage]) -> tuple[str, dict]:
+        text = self.respond(messages)
+        return text, self._usage(messages, text)
+
+    def _result(self, text: str, usage: dict) -> ChatResult:
+        message = AIMessage(content=text, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _pieces(self, text: str) -> list[str]:
+        return _TOKEN.findall(text)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text, usage = self._answer(messages)
+        time.sleep(self._generation_time(text))
+        return self._result(text, usage)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text, usage = self._answer(messages)
+        await asyncio.sleep(self._generation_time(text))
+        return self._result(text, usage)
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        text, usage = self._answer(messages)
+        time.sleep(self.latency)
+        pieces = self._pieces(text)
+        for i, piece in enumerate(pieces):
+            if self.tokens_per_second and piece.strip():
+                time.sleep(1 / self.tokens_per_second)
+            last = i == len(pieces) - 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage if last else None))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        text, usage = self._answer(messages)
+        await asyncio.sleep(self.latency)
+        pieces = self._pieces(text)
+        for i, piece in enumerate(pieces):
+            if self.tokens_per_second and piece.strip():
+                await asyncio.sleep(1 / self.tokens_per_second)
+            last = i == len(pieces) - 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage if last else None))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
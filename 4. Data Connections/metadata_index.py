@@ -0,0 +1,237 @@
+#Metadata pre-filter index for filtered similarity search
+#
+#Chunks from PyPDFLoader / CSVLoader / WebBaseLoader carry metadata like
+#   {"source": "Attention is all you need - Research paper.pdf", "page": 3}
+#   {"source": "penguins.csv", "row": 17}
+#Restricting a search to one source today means "search everything, then drop the
+#hits from other sources" (you may end up with fewer than k results) or scanning
+#the whole collection.
+#
+#MetadataIndex keeps a posting list (sorted row numbers) per (key, value). A filter is
+#turned into a candidate row set BEFORE the vector scan, and only those rows are scored:
+#the more selective the filter, the less work the scan does.
+#
+#Filters use the Chroma `where` syntax:
+#   {"source": "penguins.csv"}
+#   {"page": {"$gte": 3, "$lt": 6}}
+#   {"$or": [{"source": "a.pdf"}, {"source": "b.pdf"}]}
+#   {"source": {"$in": [...]}}, {"page": {"$ne": 0}}, {"source": {"$nin": [...]}}
+#Several keys in one dict are ANDed.
+
+import bisect
+from collections import defaultdict
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+#above this fraction of rows a masked full scan beats gathering the candidate rows
+FULL_SCAN_FRACTION = 0.5
+
+_FIELD_OPERATORS = {"$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt", "$lte"}
+_SCALAR = (str, int, float, bool)
+
+
+def _typed(value: Any) -> tuple[str, Any]:
+    #posting-list key: True == 1 and hash(True) == hash(1), so a bare value would let
+    #{"page": True} match page 1 and {"flag": 0} match False. 1 and 1.0 stay equal.
+    if isinstance(value, bool):
+        return ("bool", value)
+    if isinstance(value, (int, float)):
+        return ("number", value)
+    return ("str", value)
+
+
+def validate_where(where: Any) -> None:
+    """Raise ValueError if ``where`` is not a filter MetadataIndex understands.
+
+    Cheap, so callers that fan a query out (sharded_vector_store.py) check once up front
+    instead of letting every shard fail on the same bad filter.
+    """
+    if where is None:
+        return
+    if not isinstance(where, dict):
+        raise ValueError(f"filter must be a dict, got {type(where).__name__}")
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            if not isinstance(condition, list):
+                raise ValueError(f"{key} expects a list of filters, got {condition!r}")
+            for part in condition:
+                validate_where(part)
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported filter operator {key!r}")
+        elif isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op not in _FIELD_OPERATORS:
+                    raise ValueError(f"Unsupported filter operator {op!r} for {key!r}")
+                if op in ("$in", "$nin"):
+                    if not isinstance(operand, list) or not all(isinstance(v, _SCALAR) for v in operand):
+                        raise ValueError(f"{op} for {key!r} expects a list of values, got {operand!r}")
+                elif not isinstance(operand, _SCALAR):
+                    raise ValueError(f"{op} for {key!r} expects a single value, got {operand!r}")
+        elif not isinstance(condition, _SCALAR):
+            raise ValueError(f"filter value for {key!r} must be a str/int/float/bool, got {condition!r}")
+
+
+class MetadataIndex:
+    """Posting list per metadata (key, value) over rows 0..len(metadatas)-1.
+
+    ``postings[key]`` is keyed by ``(type tag, value)`` (see ``_typed``): bools never
+    match numbers, ints match equal floats.
+    """
+
+    def __init__(self, metadatas: Sequence[Optional[dict]]):
+        self.size = len(metadatas)
+        lists: dict[str, dict[tuple[str, Any], list[int]]] = defaultdict(lambda: defaultdict(list))
+        for row, metadata in enumerate(metadatas):
+            for key, value in (metadata or {}).items():
+                if isinstance(value, _SCALAR):
+                    lists[key][_typed(value)].append(row)
+        self.postings = {
+            key: {typed: np.asarray(rows, dtype=np.int64) for typed, rows in values.items()}
+            for key, values in lists.items()
+        }
+        #sorted distinct values per key, for range operators
+        self._sorted_values = {}
+        for key, values in self.postings.items():
+            numeric = [v for tag, v in values if tag == "number"]
+            text = [v for tag, v in values if tag == "str"]
+            self._sorted_values[key] = (sorted(numeric), sorted(text))
+
+    def _rows(self, key: str, value: Any) -> np.ndarray:
+        return self.postings.get(key, {}).get(_typed(value), _EMPTY)
+
+    # ---- filter evaluation ------------------------------------------------------
+
+    def _union(self, arrays: list[np.ndarray]) -> np.ndarray:
+        arrays = [a for a in arrays if len(a)]
+        if not arrays:
+            return _EMPTY
+        if len(arrays) == 1:
+            return arrays[0]
+        if sum(len(a) for a in arrays) * 64 < self.size:
+            return np.unique(np.concatenate(arrays))  # few rows: sort-merge is cheapest
+        bitmap = np.zeros(self.size, dtype=bool)  # many rows: O(rows) bitmap, no sort
+        for rows in arrays:
+            bitmap[rows] = True
+        return np.flatnonzero(bitmap)
+
+    def _complement(self, rows: np.ndarray) -> np.ndarray:
+        bitmap = np.ones(self.size, dtype=bool)
+        bitmap[rows] = False
+        return np.flatnonzero(bitmap)
+
+    def _intersect(self, arrays: list[Optional[np.ndarray]]) -> Optional[np.ndarray]:
+        arrays = sorted((a for a in arrays if a is not None), key=len)  # None = no constraint
+        if not arrays:
+            return None
+        #smallest first keeps every step cheap
+        result = arrays[0]
+        for other in arrays[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result
+
+    def _range(self, key: str, op: str, bound: Any) -> np.ndarray:
+        if isinstance(bound, bool):
+            return _EMPTY  # bools are not ordered against numbers here
+        numeric, text = self._sorted_values.get(key, ([], []))
+        values = text if isinstance(bound, str) else numeric
+        if op == "$gt":
+            selected = values[bisect.bisect_right(values, bound):]
+        elif op == "$gte":
+            selected = values[bisect.bisect_left(values, bound):]
+        elif op == "$lt":
+            selected = values[:bisect.bisect_left(values, bound)]
+        else:  # $lte
+            selected = values[:bisect.bisect_right(values, bound)]
+        return self._union([self._rows(key, v) for v in selected])
+
+    def _field(self, key: str, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            return self._rows(key, condition)
+        parts = []
+        for op, operand in condition.items():
+            if op == "$eq":
+                parts.append(self._rows(key, operand))
+            elif op == "$ne":
+                parts.append(self._complement(self._rows(key, operand)))
+            elif op == "$in":
+                parts.append(self._union([self._rows(key, v) for v in operand]))
+            elif op == "$nin":
+                excluded = self._union([self._rows(key, v) for v in operand])
+                parts.append(self._complement(excluded))
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                parts.append(self._range(key, op, operand))
+            else:
+                raise ValueError(f"Unsupported filter operator {op!r} for {key!r}")
+        return self._intersect(parts)
+
+    def candidates(self, where: Optional[dict]) -> Optional[np.ndarray]:
+        """Sorted row numbers matching ``where``; None means "no filter, every row"."""
+        if not where:
+            return None
+        parts = []
+        for key, condition in where.items():
+            if key == "$and":
+                parts.append(self._intersect([self.candidates(c) for c in condition]))
+            elif key == "$or":
+                alternatives = [self.candidates(c) for c in condition]
+                #an empty alternative matches every row
+                parts.append(None if any(a is None for a in alternatives) else self._union(alternatives))
+            else:
+                parts.append(self._field(key, condition))
+        return self._intersect(parts)
+
+
+def filtered_top_k(vectors: np.ndarray, queries: np.ndarray, k: int,
+                   rows: Optional[np.ndarray]) -> list[list[tuple[float, int]]]:
+    """Top-k (score, row) per query, scoring only ``rows`` (None = all rows)."""
+    if rows is not None and not len(rows):
+        return [[] for _ in range(len(queries))]
+
+    if rows is None:
+        scores, row_of = queries @ vectors.T, None
+    elif len(rows) > FULL_SCAN_FRACTION * len(vectors):
+        #contiguous full scan, then keep only the candidate columns
+        scores, row_of = (queries @ vectors.T)[:, rows], rows
+    else:
+        scores, row_of = queries @ vectors[rows].T, rows  # gathers only the candidate rows
+
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    results = []
+    for score_row, candidates in zip(scores, top):
+        results.append([
+            (float(score_row[c]), int(row_of[c]) if row_of is not None else int(c))
+            for c in candidates
+        ])
+    return results
+
+
+if __name__ == "__main__":
+    import time
+
+    #synthetic corpus: 200k chunks from 1000 sources with 50 pages each
+    count, dim = 200_000, 64
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    metadatas = [{"source": f"doc-{i % 1000}.pdf", "page": i % 50} for i in range(count)]
+    index = MetadataIndex(metadatas)
+    queries = rng.standard_normal((16, dim), dtype=np.float32)
+
+    for label, where in [
+        ("no filter", None),
+        ("page < 40 (80%)", {"page": {"$lt": 40}}),
+        ("page < 10 (20%)", {"page": {"$lt": 10}}),
+        ("one source (0.1%)", {"source": "doc-7.pdf"}),
+        ("one source + page (0.002%)", {"$and": [{"source": "doc-7.pdf"}, {"page": 7}]}),
+    ]:
+        started = time.perf_counter()
+        for _ in range(20):
+            hits = filtered_top_k(vectors, queries, 4, index.candidates(where))
+        per_query_ms = (time.perf_counter() - started) / (20 * len(queries)) * 1000
+        print(f"{label:<28}{per_query_ms:8.3f} ms/query")
@@ -0,0 +1,283 @@
+#Offline end-to-end RAG benchmark
+#
+#   load -> split -> embed -> index -> retrieve -> generate -> parse
+#
+#Runs the Simple RAG.py pipeline on a synthetic corpus with the fake providers from
+#fake_providers.py (no API keys, no network, deterministic), at several corpus sizes and
+#concurrency levels, and writes the numbers to a JSON file:
+#
+#   python "4. Data Connections/rag_benchmark.py" --sizes 100 1000 --concurrency 1 8 32 --output bench.json
+#
+#Compare two versions of the code:
+#
+#   python "4. Data Connections/rag_benchmark.py" --output new.json --baseline old.json
+#
+#Per corpus size: seconds spent in each ingest stage and the peak RSS of ingest + queries
+#(every size runs in a fresh process, so sizes don't inherit each other's memory).
+#Per concurrency level: throughput and p50/p99 latency of retrieve -> generate -> parse
+#(through RagServer, so retrieval is micro-batched like in production).
+
+import argparse
+import asyncio
+import importlib.metadata
+import json
+import multiprocessing as mp
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from fake_providers import FakeChatModel, FakeEmbeddings
+from rag_server import ChromaIndex, InMemoryIndex, RagServer, run_load
+
+HERE = Path(__file__).resolve().parent
+#run settings that don't change what one measurement means: where the file goes, what it
+#is compared against, and which sizes/levels ran (results are matched by size + level)
+_NOT_COMPARED = {"output", "baseline", "tolerance", "sizes", "concurrency"}
+PACKAGES = ("langchain-core", "langchain-community", "langchain-text-splitters", "langchain-chroma", "chromadb", "numpy")
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "pa", "qu", "xi", "do", "fe", "gu", "ha"]
+
+
+# ---- synthetic corpus -------------------------------------------------------------
+
+
+def _vocabulary(rng: random.Random, size: int) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def synthetic_corpus(directory: Path, n_docs: int, words_per_doc: int = 300,
+                     n_topics: int = 20, seed: int = 0) -> tuple[list[Path], list[str]]:
+    """Write ``n_docs`` text files under ``directory``; return (paths, questions).
+
+    Every document is about one topic and mostly uses that topic's words, so similarity
+    search has something real to find. The questions are built from topic words too.
+    """
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng, 2000)
+    common = vocabulary[:200]
+    topics = [vocabulary[200 + i * 40: 240 + i * 40] for i in range(n_topics)]
+
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(n_docs):
+        topic = topics[i % n_topics]
+        words = [rng.choice(topic) if rng.random() < 0.6 else rng.choice(common) for _ in range(words_per_doc)]
+        sentences = [" ".join(words[j:j + 12]).capitalize() + "." for j in range(0, len(words), 12)]
+        paragraphs = ["\n".join(sentences[j:j + 5]) for j in range(0, len(sentences), 5)]
+        path = directory / f"doc_{i:06d}.txt"
+        path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+        paths.append(path)
+
+    questions = [f"What does {' '.join(rng.sample(topic, 3))} mean?" for topic in topics for _ in range(5)]
+    return paths, questions
+
+
+# ---- measurements -----------------------------------------------------------------
+
+
+def peak_rss_mb() -> Optional[float]:
+    #process high-water mark: only meaningful once per process, see run_size()
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": versions,
+    }
+
+
+class _Timer:
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+
+    def __call__(self, name: str):
+        timer = self
+
+        class _Stage:
+            def __enter__(self):
+                self.started = time.perf_counter()
+
+            def __exit__(self, *exc):
+                timer.stages[name] = round(time.perf_counter() - self.started, 4)
+
+        return _Stage()
+
+
+# ---- pipeline ---------------------------------------------------------------------
+
+
+def ingest(paths: list[Path], embedding: FakeEmbeddings, store: str, timer: _Timer, embed_batch: int = 256):
+    from langchain_community.document_loaders import TextLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    with timer("load"):
+        docs = [doc for path in paths for doc in TextLoader(str(path), encoding="utf-8").load()]
+
+    with timer("split"):
+        #same settings as Simple RAG.py
+        chunks = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=50).split_documents(docs)
+
+    with timer("embed"):
+        texts = [c.page_content for c in chunks]
+        vectors = []
+        for start in range(0, len(texts), embed_batch):
+            vectors.extend(embedding.embed_documents(texts[start:start + embed_batch]))
+
+    with timer("index"):
+        if store == "chroma":
+            from langchain_chroma import Chroma
+
+            chroma = Chroma(collection_name=f"bench_{uuid.uuid4().hex[:8]}", embedding_function=embedding)
+            step = 5000  # below chromadb's max batch size
+            for start in range(0, len(chunks), step):
+                part = chunks[start:start + step]
+                chroma._collection.add(
+                    ids=[str(start + i) for i in range(len(part))],
+                    embeddings=vectors[start:start + step],
+                    documents=[c.page_content for c in part],
+                    metadatas=[c.metadata for c in part],
+                )
+            index = ChromaIndex(chroma)
+        else:
+            index = InMemoryIndex(chunks, vectors)
+    return index, len(docs), len(chunks)
+
+
+def run_size(size: int, corpus_dir: Path, args: argparse.Namespace) -> dict:
+    """Ingest + query one corpus size; runs in its own process (see main)."""
+    paths, questions = synthetic_corpus(corpus_dir, size, args.words_per_doc, seed=args.seed)
+    embedding = FakeEmbeddings(latency=args.embed_latency, tokens_per_second=args.embed_tokens_per_second)
+    timer = _Timer()
+    index, n_docs, n_chunks = ingest(paths, embedding, args.store, timer)
+    print(f"docs={n_docs} chunks={n_chunks} ingest={timer.stages}")
+    runs = asyncio.run(query_phase(index, embedding, questions, args))
+    if isinstance(index, ChromaIndex):
+        index.store.delete_collection()
+    return {
+        "corpus_docs": n_docs,
+        "chunks": n_chunks,
+        "ingest_seconds": timer.stages,
+        "ingest_chunks_per_s": round(n_chunks / max(sum(timer.stages.values()), 1e-9), 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "runs": runs,
+    }
+
+
+async def query_phase(index, embedding, questions, args) -> list[dict]:
+    runs = []
+    for concurrency in args.concurrency:
+        llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second)
+        server = RagServer(embedding, index, llm, k=4, window=args.window_ms / 1000)
+        report = await run_load(server, questions, args.requests, concurrency)
+        report["concurrency"] = concurrency
+        runs.append(report)
+        print(f"  concurrency={concurrency:<4} {report['throughput_rps']:>8} req/s  "
+              f"p50={report['p50_ms']}ms  p99={report['p99_ms']}ms")
+    return runs
+
+
+def compare(results: dict, baseline_path: Path, tolerance: float) -> bool:
+    """Print throughput/p99 changes vs. a previous results file; True if anything regressed.
+
+    Refuses (SystemExit) when the two runs used different settings (store, latencies,
+    token rates, window, ...): their numbers are not comparable.
+    """
+    baseline = json.loads(baseline_path.read_text())
+    differences = {
+        key: (baseline.get("config", {}).get(key), value)
+        for key, value in results["config"].items()
+        if key not in _NOT_COMPARED and baseline.get("config", {}).get(key) != value
+    }
+    if differences:
+        raise SystemExit(f"{baseline_path} was run with different settings, not comparing: "
+                         + ", ".join(f"{k}: {old!r} -> {new!r}" for k, (old, new) in differences.items()))
+    before = {
+        (size["corpus_docs"], run["concurrency"]): run
+        for size in baseline["results"] for run in size["runs"]
+    }
+    regressed = False
+    print(f"\nvs. {baseline_path} ({baseline['environment'].get('git_commit')})")
+    for size in results["results"]:
+        for run in size["runs"]:
+            old = before.get((size["corpus_docs"], run["concurrency"]))
+            if old is None:
+                continue
+            throughput = run["throughput_rps"] / old["throughput_rps"] if old["throughput_rps"] else 1.0
+            p99 = run["p99_ms"] / old["p99_ms"] if old["p99_ms"] else 1.0
+            bad = throughput < 1 - tolerance or p99 > 1 + tolerance
+            regressed |= bad
+            print(f"  docs={size['corpus_docs']:<6} concurrency={run['concurrency']:<4} "
+                  f"throughput x{throughput:.2f}  p99 x{p99:.2f}{'  REGRESSION' if bad else ''}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end RAG benchmark with fake providers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000], help="documents in the corpus")
+    parser.add_argument("--words-per-doc", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="questions per concurrency level")
+    parser.add_argument("--store", choices=["chroma", "memory"], default="chroma")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="seconds per embedding call")
+    parser.add_argument("--embed-tokens-per-second", type=float, default=1_000_000)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200)
+    parser.add_argument("--window-ms", type=float, default=5, help="retrieval micro-batch window")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=Path("rag_benchmark.json"))
+    parser.add_argument("--baseline", type=Path, help="previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    results = {
+        "environment": environment(),
+        "config": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            #a fresh process per size: its peak RSS is this size's ingest + query peak,
+            #not the high-water mark left behind by the previous sizes
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+                result = pool.submit(run_size, size, Path(tmp) / f"corpus_{size}", args).result()
+            print(f"  peak rss={result['peak_rss_mb']}MB")
+            results["results"].append(result)
+
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"\nwrote {args.output}")
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
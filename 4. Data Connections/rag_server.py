@@ -0,0 +1,317 @@
+#Long-lived RAG server: load the index once, micro-batch retrieval, answer concurrently
+#
+#Simple RAG.py is a one-shot script: every run re-loads the PDF/CSV/web page, re-splits,
+#re-embeds and rebuilds Chroma before answering ONE question. Here:
+#
+#   startup:   open the persisted Chroma collection once, keep it resident
+#              ("4. Data Connections/chroma_db_all_docs", written by `python main.py ingest`)
+#   per query: questions arriving within `window` seconds are collected into one batch
+#              -> ONE embed_documents call for the whole batch
+#              -> ONE batched vector search (collection.query with many query embeddings)
+#              -> prompt | llm | parser for every question concurrently
+#
+#   python main.py serve                                    # serve the persisted index (OpenAI keys needed)
+#   python "4. Data Connections/rag_server.py" --fake       # offline load test with fake model/embeddings
+#
+#Protocol: one JSON object per line over TCP, {"question": "..."} -> {"summary": ..., "sources": [...]}
+
+import argparse
+import asyncio
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Any, Optional, Protocol, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel
+
+HERE = Path(__file__).resolve().parent
+#where `python main.py ingest` persists; Simple RAG.py writes "Data Connections/chroma_db_all_docs"
+#relative to the working directory instead, pass that path explicitly to serve it
+PERSIST_DIRECTORY = HERE / "chroma_db_all_docs"
+
+#same prompt / output model as Simple RAG.py
+prompt = ChatPromptTemplate.from_template("""
+Use ONLY the following context to answer the question.
+If the answer is not in the context, say "I don't know".
+
+{format_instructions}
+
+Context:
+{context}
+
+Question:
+{question}
+""")
+
+
+class Answer(BaseModel):
+    summary: str
+    sources: list[str]
+
+
+# ---- resident indexes -------------------------------------------------------------
+
+
+class BatchIndex(Protocol):
+    def search_batch(self, vectors: Sequence[list[float]], k: int) -> list[list[Document]]: ...
+
+
+class ChromaIndex:
+    """Chroma collection kept open for the process lifetime; many query vectors per search call."""
+
+    def __init__(self, store):
+        self.store = store
+
+    @classmethod
+    def from_persisted(cls, persist_directory: Path, embedding: Embeddings,
+                       collection_name: str = "langchain") -> "ChromaIndex":
+        from langchain_chroma import Chroma
+
+        return cls(Chroma(
+            collection_name=collection_name,
+            embedding_function=embedding,
+            persist_directory=str(persist_directory),
+        ))
+
+    def search_batch(self, vectors: Sequence[list[float]], k: int) -> list[list[Document]]:
+        #private _collection on purpose: langchain_chroma's public search methods take one
+        #query at a time, only the chromadb collection accepts many query embeddings per call
+        found = self.store._collection.query(
+            query_embeddings=list(vectors), n_results=k, include=["documents", "metadatas"]
+        )
+        return [
+            [Document(page_content=text, metadata=meta or {}) for text, meta in zip(texts, metas)]
+            for texts, metas in zip(found["documents"], found["metadatas"])
+        ]
+
+
+class InMemoryIndex:
+    """Dot-product index for normalized vectors kept in one numpy matrix (used with fake providers).
+
+    A batch of queries is a single matrix multiply.
+    """
+
+    def __init__(self, documents: list[Document], vectors: list[list[float]]):
+        self.documents = documents
+        self.matrix = np.asarray(vectors, dtype=np.float32)
+
+    @classmethod
+    def from_documents(cls, documents: list[Document], embedding: Embeddings) -> "InMemoryIndex":
+        return cls(documents, embedding.embed_documents([d.page_content for d in documents]))
+
+    def search_batch(self, vectors: Sequence[list[float]], k: int) -> list[list[Document]]:
+        scores = np.asarray(vectors, dtype=np.float32) @ self.matrix.T  # (queries, documents)
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row[candidates])]
+            results.append([self.documents[i] for i in ordered])
+        return results
+
+
+# ---- micro-batching ---------------------------------------------------------------
+
+
+class MicroBatcher:
+    """Collects concurrent questions for up to ``window`` seconds (or ``max_batch`` items)
+    and retrieves them with one embedding call and one vector search."""
+
+    def __init__(self, embedding: Embeddings, index: BatchIndex, k: int = 4,
+                 window: float = 0.005, max_batch: int = 64):
+        self.embedding = embedding
+        self.index = index
+        self.k = k
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.questions = 0
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def retrieve(self, question: str) -> list[Document]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((question, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)  # keep a reference until it finishes
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.questions += len(batch)
+        try:
+            vectors = await self.embedding.aembed_documents([q for q, _ in batch])
+            found = await asyncio.to_thread(self.index.search_batch, vectors, self.k)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), docs in zip(batch, found):
+            if not future.done():
+                future.set_result(docs)
+
+
+# ---- server -----------------------------------------------------------------------
+
+
+def format_docs(docs: list[Document]) -> str:
+    return "\n\n".join(f"[{d.metadata.get('source', '?')}] {d.page_content}" for d in docs)
+
+
+def latency_summary(latencies: list[float], elapsed: float) -> dict:
+    ordered = sorted(latencies)
+
+    def pct(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2) if ordered else 0.0
+
+    return {
+        "requests": len(ordered),
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+    }
+
+
+class RagServer:
+    def __init__(self, embedding: Embeddings, index: BatchIndex, llm: BaseChatModel,
+                 k: int = 4, window: float = 0.005, max_batch: int = 64):
+        self.batcher = MicroBatcher(embedding, index, k=k, window=window, max_batch=max_batch)
+        parser = PydanticOutputParser(pydantic_object=Answer)
+        self.chain = prompt.partial(format_instructions=parser.get_format_instructions()) | llm | parser
+        self.latencies: list[float] = []
+
+    async def answer(self, question: str) -> Answer:
+        started = time.perf_counter()
+        docs = await self.batcher.retrieve(question)
+        result = await self.chain.ainvoke({"context": format_docs(docs), "question": question})
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    reply = (await self.answer(json.loads(line)["question"])).model_dump()
+                except Exception as e:
+                    reply = {"error": f"{type(e).__name__}: {e}"}
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"RAG server listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+async def serve_persisted(host: str = "127.0.0.1", port: int = 8765,
+                          persist_directory: Path = PERSIST_DIRECTORY, **kwargs: Any) -> None:
+    """Serve a persisted index (default: the one `main.py ingest` builds) with OpenAI embeddings + chat model."""
+    from dotenv import load_dotenv
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+    load_dotenv()
+    embedding = OpenAIEmbeddings()
+    server = RagServer(embedding, ChromaIndex.from_persisted(persist_directory, embedding), ChatOpenAI(), **kwargs)
+    await server.serve_forever(host, port)
+
+
+# ---- offline load generator -------------------------------------------------------
+
+
+def penguin_documents() -> list[Document]:
+    #same content CSVLoader would produce for penguins.csv, without langchain_community
+    with open(HERE / "penguins.csv", newline="") as f:
+        return [
+            Document(
+                page_content="\n".join(f"{key}: {value}" for key, value in row.items()),
+                metadata={"source": "penguins.csv", "row": i},
+            )
+            for i, row in enumerate(csv.DictReader(f))
+        ]
+
+
+async def run_load(server: RagServer, questions: list[str], total: int, concurrency: int) -> dict:
+    latencies_before = len(server.latencies)
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(questions[i % len(questions)])
+
+    async def client() -> None:
+        while not queue.empty():
+            await server.answer(queue.get_nowait())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return latency_summary(server.latencies[latencies_before:], elapsed)
+
+
+async def fake_load_test(args: argparse.Namespace) -> None:
+    from fake_providers import FakeChatModel, FakeEmbeddings
+
+    embedding = FakeEmbeddings(latency=args.embed_latency)
+    index = InMemoryIndex.from_documents(penguin_documents(), embedding)
+    embedding.calls = embedding.texts_embedded = 0
+    questions = [
+        f"What is the {field} of {species} penguins on {island}?"
+        for field in ("bill length", "flipper length", "body mass")
+        for species in ("Adelie", "Gentoo", "Chinstrap")
+        for island in ("Torgersen", "Biscoe", "Dream")
+    ]
+    for window in args.windows:
+        server = RagServer(embedding, index, FakeChatModel(latency=args.llm_latency),
+                           window=window / 1000, max_batch=args.max_batch)
+        calls_before = embedding.calls
+        report = await run_load(server, questions, args.requests, args.concurrency)
+        report["window_ms"] = window
+        report["embed_calls"] = embedding.calls - calls_before
+        report["avg_batch"] = round(server.batcher.questions / max(server.batcher.batches, 1), 1)
+        print(json.dumps(report))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Long-lived RAG server with micro-batched retrieval")
+    parser.add_argument("--fake", action="store_true", help="offline load test with fake providers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 10], help="batch windows (ms)")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="seconds per embedding call")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per chat call")
+    args = parser.parse_args()
+
+    if args.fake:
+        asyncio.run(fake_load_test(args))
+    else:
+        asyncio.run(serve_persisted(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
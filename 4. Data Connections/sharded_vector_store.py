@@ -0,0 +1,315 @@
+#Sharded vector store: N shards, one worker process each, queried in parallel
+#
+#3_Vector_Stores.py puts every chunk in ONE Chroma collection (Collection(name=langchain)),
+#and a similarity search scans it on a single core. Here the collection is split into
+#N shards by hash of the chunk id:
+#
+#   shard_dir/
+#     shard_0/vectors.npy    float32, L2-normalized, opened with mmap_mode="r"
+#     shard_0/records.json   ids, documents, metadatas
+#     shard_1/...
+#
+#Each shard is served by its own process (memory-mapped, so the OS page cache is shared
+#and nothing is copied into the parent). A query batch is sent to every shard, each shard
+#returns its local top-k, and the parent merges N*k candidates into the global top-k.
+#
+#   store = ShardedVectorStore.from_chroma(vectorstore._collection, "chroma_shards", n_shards=4,
+#                                          embedding=OpenAIEmbeddings())
+#   store.similarity_search("What is the pdf about", k=4)
+#   store.as_retriever(search_kwargs={"k": 4})
+
+import json
+import multiprocessing as mp
+import os
+import shutil
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from metadata_index import MetadataIndex, filtered_top_k, validate_where
+
+#one BLAS thread per shard process: the shards ARE the parallelism
+_SINGLE_THREAD_ENV = {
+    "OMP_NUM_THREADS": "1",
+    "OPENBLAS_NUM_THREADS": "1",
+    "MKL_NUM_THREADS": "1",
+}
+
+
+def shard_of(doc_id: str, n_shards: int) -> int:
+    #crc32, not hash(): must be stable across processes and runs
+    return zlib.crc32(doc_id.encode()) % n_shards
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def write_shards(
+    directory: Path,
+    ids: Sequence[str],
+    vectors: np.ndarray,
+    n_shards: int,
+    documents: Optional[Sequence[Optional[str]]] = None,
+    metadatas: Optional[Sequence[Optional[dict]]] = None,
+    overwrite: bool = False,
+) -> None:
+    """Split (ids, vectors, documents, metadatas) into ``n_shards`` directories under ``directory``.
+
+    An existing shard directory is only replaced with ``overwrite=True``; a non-empty
+    directory that is not a shard directory (no shards.json) is never deleted.
+    """
+    directory = Path(directory)
+    if directory.exists() and any(directory.iterdir()):
+        if not (directory / "shards.json").exists():
+            raise ValueError(f"{directory} is not empty and is not a shard directory (no shards.json)")
+        if not overwrite:
+            raise FileExistsError(f"{directory} already holds shards; pass overwrite=True to replace them")
+        shutil.rmtree(directory)
+    vectors = _normalize(vectors)
+    assignment = np.fromiter((shard_of(i, n_shards) for i in ids), dtype=np.int64, count=len(ids))
+    for shard in range(n_shards):
+        rows = np.flatnonzero(assignment == shard)
+        shard_dir = directory / f"shard_{shard}"
+        shard_dir.mkdir(parents=True)
+        np.save(shard_dir / "vectors.npy", vectors[rows])
+        with open(shard_dir / "records.json", "w") as f:
+            json.dump({
+                "ids": [ids[r] for r in rows],
+                "documents": [documents[r] for r in rows] if documents is not None else None,
+                "metadatas": [metadatas[r] for r in rows] if metadatas is not None else None,
+            }, f)
+    with open(directory / "shards.json", "w") as f:
+        json.dump({"n_shards": n_shards, "dim": int(vectors.shape[1]), "count": len(ids)}, f)
+
+
+# ---- worker side ------------------------------------------------------------------
+
+
+class _Shard:
+    def __init__(self, shard_dir: Path):
+        self.vectors = np.load(shard_dir / "vectors.npy", mmap_mode="r")
+        with open(shard_dir / "records.json") as f:
+            records = json.load(f)
+        self.ids = records["ids"]
+        self.documents = records["documents"]
+        self.metadatas = records["metadatas"]
+        self.metadata_index = MetadataIndex(self.metadatas or [None] * len(self.ids))
+
+    def search(self, queries: np.ndarray, k: int, where: Optional[dict] = None) -> list[list[tuple]]:
+        if len(self.ids) == 0:
+            return [[] for _ in range(len(queries))]
+        #filter first: only candidate rows are scored
+        rows = self.metadata_index.candidates(where)
+        return [
+            [
+                (
+                    score,
+                    self.ids[i],
+                    self.documents[i] if self.documents is not None else None,
+                    self.metadatas[i] if self.metadatas is not None else None,
+                )
+                for score, i in hits
+            ]
+            for hits in filtered_top_k(self.vectors, queries, k, rows)
+        ]
+
+
+def _serve_shard(shard_dir: str, conn) -> None:
+    #every request gets exactly one ("ok", result) or ("error", exception) reply, so one
+    #failing shard neither kills the worker nor leaves the other pipes out of step
+    try:
+        shard = _Shard(Path(shard_dir))
+    except Exception as e:
+        conn.send(("error", e))
+        conn.close()
+        return
+    conn.send(("ok", None))
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        queries, k, where = message
+        try:
+            conn.send(("ok", shard.search(queries, k, where)))
+        except Exception as e:
+            conn.send(("error", e))
+    conn.close()
+
+
+# ---- parent side ------------------------------------------------------------------
+
+
+class ShardedIndex:
+    """Worker processes over a sharded directory; ``search_batch`` fans out and merges."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        with open(self.directory / "shards.json") as f:
+            self.info = json.load(f)
+        ctx = mp.get_context("spawn")
+        #one request in flight per pipe: replies carry no request id, so a second thread
+        #sending before the first one has gathered would read the other thread's results
+        self._lock = threading.Lock()
+        self._conns = []
+        self._procs = []
+        saved = {key: os.environ.get(key) for key in _SINGLE_THREAD_ENV}
+        os.environ.update(_SINGLE_THREAD_ENV)  # inherited by the spawned workers
+        try:
+            for shard in range(self.info["n_shards"]):
+                parent_conn, child_conn = ctx.Pipe()
+                proc = ctx.Process(
+                    target=_serve_shard,
+                    args=(str(self.directory / f"shard_{shard}"), child_conn),
+                    daemon=True,
+                )
+                proc.start()
+                self._conns.append(parent_conn)
+                self._procs.append(proc)
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        try:
+            self._gather()  # wait until every shard has its data mapped
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def n_shards(self) -> int:
+        return len(self._procs)
+
+    def search_batch(self, vectors: Sequence[Sequence[float]], k: int,
+                     filter: Optional[dict] = None) -> list[list[tuple]]:
+        """Top-k (score, id, document, metadata) per query vector, best first.
+
+        ``filter`` is a Chroma-style metadata filter (see metadata_index.py), applied
+        inside every shard before the vector scan. An invalid filter raises ValueError
+        here, before anything is sent to the shards.
+        """
+        validate_where(filter)
+        queries = _normalize(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        with self._lock:
+            for conn in self._conns:
+                conn.send((queries, k, filter))
+            per_shard = self._gather()
+        merged = []
+        for q in range(len(queries)):
+            candidates = [hit for shard in per_shard for hit in shard[q]]
+            candidates.sort(key=lambda hit: hit[0], reverse=True)
+            merged.append(candidates[:k])
+        return merged
+
+    def _gather(self) -> list:
+        #read every shard's reply before raising, so the next request starts in step
+        replies = [conn.recv() for conn in self._conns]
+        for status, payload in replies:
+            if status == "error":
+                raise payload
+        return [payload for _, payload in replies]
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+            for proc in self._procs:
+                proc.join(timeout=5)
+            self._conns, self._procs = [], []
+
+    def __enter__(self) -> "ShardedIndex":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class ShardedVectorStore(VectorStore):
+    """Read-only LangChain VectorStore over a ShardedIndex (works with .as_retriever()).
+
+    Documents go in only through ``from_texts`` / ``from_chroma``, which write the shard
+    files; to add documents, rebuild with ``overwrite=True``. ``add_texts`` is the base
+    class one and raises NotImplementedError.
+    """
+
+    def __init__(self, directory: Path, embedding: Embeddings):
+        self.index = ShardedIndex(directory)
+        self._embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def similarity_search_with_score_by_vector(self, embedding: list[float], k: int = 4,
+                                               filter: Optional[dict] = None,
+                                               **kwargs: Any) -> list[tuple[Document, float]]:
+        hits = self.index.search_batch([embedding], k, filter)[0]
+        return [
+            (Document(id=doc_id, page_content=text or "", metadata=meta or {}), score)
+            for score, doc_id, text, meta in hits
+        ]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score  # cosine similarity already in [-1, 1]
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: Optional[list[dict]] = None,
+                   *, directory: Path, n_shards: int = 4, ids: Optional[list[str]] = None,
+                   overwrite: bool = False, **kwargs: Any) -> "ShardedVectorStore":
+        ids = ids or [str(i) for i in range(len(texts))]
+        write_shards(directory, ids, np.asarray(embedding.embed_documents(texts)), n_shards, texts, metadatas,
+                     overwrite=overwrite)
+        return cls(directory, embedding)
+
+    @classmethod
+    def from_chroma(cls, collection, directory: Path, n_shards: int, embedding: Embeddings,
+                    overwrite: bool = False) -> "ShardedVectorStore":
+        """Shard an existing Chroma collection (e.g. ``vectorstore._collection``)."""
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        write_shards(directory, data["ids"], np.asarray(data["embeddings"]), n_shards,
+                     data["documents"], data["metadatas"], overwrite=overwrite)
+        return cls(directory, embedding)
+
+    def close(self) -> None:
+        self.index.close()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from langchain_chroma import Chroma
+    from langchain_openai import OpenAIEmbeddings
+
+    load_dotenv()
+    here = Path(__file__).resolve().parent
+    embedding_model = OpenAIEmbeddings()
+
+    #the collection built by 3_Vector_Stores.py
+    vectorstore = Chroma(embedding_function=embedding_model, persist_directory=str(here / "chroma_db"))
+    store = ShardedVectorStore.from_chroma(vectorstore._collection, here / "chroma_shards", 4, embedding_model,
+                                           overwrite=True)
+    print(store.similarity_search("What is the pdf about", k=4))
+    print(store.similarity_search("multi-head attention", k=4, filter={"page": {"$lte": 4}}))
+    store.close()
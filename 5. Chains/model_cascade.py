@@ -0,0 +1,234 @@
+#Model cascade: try the cheap/fast model first, escalate only when its answer is bad
+#
+#   input --> [tier 0: gpt-4o-mini] --validator ok?--> output
+#                     | no
+#                     v
+#             [tier 1: gpt-4.1] --validator ok?--> output
+#                     | no (last tier)
+#                     v
+#                 raise error
+#
+#"no" also covers a tier that fails outright (rate limit, timeout, connection error): the
+#bigger model is a different deployment, often a different quota, so it is worth a try.
+#Errors raised by the validator itself (other than `escalate_on`) are bugs and propagate.
+#
+#Unlike RunnableBranch (section 3 of langchain_v_1_chains_overview.md) the route is not
+#decided up front: every request starts at the lowest tier and a cheap LOCAL check
+#(e.g. "does it parse with the chain's PydanticOutputParser?") decides whether to go up.
+#Most traffic is then answered by the low-latency tier and only hard inputs pay for the big model.
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Optional, Sequence, Union
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import patch_config
+
+
+class TierStats:
+    """Counters + recent latency samples for one tier of the cascade."""
+
+    def __init__(self, name: str, max_samples: int = 2048):
+        self.name = name
+        self.calls = 0        # requests that reached this tier
+        self.served = 0       # requests answered by this tier
+        self.rejected = 0     # outputs that failed validation -> escalated
+        self.errors = 0       # tier call raised (provider error) -> escalated, or aborted if last
+        self.latencies = deque(maxlen=max_samples)  # seconds (model call + validation)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "served": self.served,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "escalation_rate": (self.rejected + self.errors) / self.calls if self.calls else 0.0,
+            "p50_ms": _to_ms(self.percentile(0.50)),
+            "p99_ms": _to_ms(self.percentile(0.99)),
+        }
+
+
+def _to_ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class ModelCascade(Runnable):
+    """Run tiers cheapest-first and return the first output that passes ``validator``.
+
+    tiers:      [(name, runnable), ...] ordered from cheapest/fastest to largest.
+                Each runnable gets the cascade input, e.g. ``prompt | ChatOpenAI(model="gpt-4o-mini")``.
+    validator:  local check applied to every tier output. Either a parser Runnable
+                (PydanticOutputParser, JsonOutputParser, ...) or a plain function.
+                Its return value becomes the cascade output; raising one of
+                ``escalate_on`` means "not good enough, try the next tier".
+                If None, the raw tier output is returned.
+    escalate_on_error: if True (default) any other exception from a tier call (rate
+                limit, timeout, ...) also moves on to the next tier; if False it propagates.
+    """
+
+    def __init__(
+        self,
+        tiers: Sequence[tuple[str, Runnable]],
+        validator: Optional[Union[Runnable, Callable[[Any], Any]]] = None,
+        escalate_on: tuple[type[BaseException], ...] = (OutputParserException, ValueError),
+        escalate_on_error: bool = True,
+    ):
+        if not tiers:
+            raise ValueError("ModelCascade needs at least one tier")
+        self.tiers = list(tiers)
+        self.validator = validator
+        self.escalate_on = escalate_on
+        self.escalate_on_error = escalate_on_error
+        self._stats = [TierStats(name) for name, _ in self.tiers]
+        self._lock = threading.Lock()
+
+    # ---- validation -------------------------------------------------------------
+
+    def _validate(self, output: Any, config: RunnableConfig) -> Any:
+        if self.validator is None:
+            return output
+        if isinstance(self.validator, Runnable):
+            return self.validator.invoke(output, config)
+        return self.validator(output)
+
+    async def _avalidate(self, output: Any, config: RunnableConfig) -> Any:
+        if isinstance(self.validator, Runnable):
+            return await self.validator.ainvoke(output, config)
+        return self._validate(output, config)
+
+    def _record(self, index: int, started: float, outcome: str) -> None:
+        #outcome: "served" / "rejected" (validation) / "error" (tier call or validator raised)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._stats[index]
+            stats.calls += 1
+            stats.latencies.append(elapsed)
+            if outcome == "served":
+                stats.served += 1
+            elif outcome == "rejected":
+                stats.rejected += 1
+            else:
+                stats.errors += 1
+
+    # ---- Runnable interface -----------------------------------------------------
+
+    def _invoke(self, input: Any, run_manager, config: RunnableConfig) -> Any:
+        last_error: Optional[BaseException] = None
+        for index, (name, tier) in enumerate(self.tiers):
+            tier_config = patch_config(config, callbacks=run_manager.get_child(f"tier:{name}"))
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                try:
+                    raw = tier.invoke(input, tier_config)
+                except self.escalate_on as e:
+                    outcome, last_error = "rejected", e
+                    continue
+                except Exception as e:
+                    if not self.escalate_on_error:
+                        raise
+                    last_error = e
+                    continue
+                try:
+                    output = self._validate(raw, tier_config)
+                except self.escalate_on as e:
+                    outcome, last_error = "rejected", e
+                    continue
+                outcome = "served"
+                return output
+            finally:
+                self._record(index, started, outcome)  # also when something propagates
+        raise last_error
+
+    async def _ainvoke(self, input: Any, run_manager, config: RunnableConfig) -> Any:
+        last_error: Optional[BaseException] = None
+        for index, (name, tier) in enumerate(self.tiers):
+            tier_config = patch_config(config, callbacks=run_manager.get_child(f"tier:{name}"))
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                try:
+                    raw = await tier.ainvoke(input, tier_config)
+                except self.escalate_on as e:
+                    outcome, last_error = "rejected", e
+                    continue
+                except Exception as e:
+                    if not self.escalate_on_error:
+                        raise
+                    last_error = e
+                    continue
+                try:
+                    output = await self._avalidate(raw, tier_config)
+                except self.escalate_on as e:
+                    outcome, last_error = "rejected", e
+                    continue
+                outcome = "served"
+                return output
+            finally:
+                self._record(index, started, outcome)
+        raise last_error
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self._call_with_config(self._invoke, input, config)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self._acall_with_config(self._ainvoke, input, config)
+
+    # ---- stats ------------------------------------------------------------------
+
+    def stats(self) -> dict:
+        """Per-tier latency/escalation numbers plus the share of traffic each tier served."""
+        with self._lock:
+            per_tier = {s.name: s.as_dict() for s in self._stats}
+            total = self._stats[0].calls
+            served = {s.name: (s.served / total if total else 0.0) for s in self._stats}
+        return {"requests": total, "served_fraction": served, "tiers": per_tier}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = [TierStats(name) for name, _ in self.tiers]
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from langchain_openai import ChatOpenAI
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import PydanticOutputParser
+    from pydantic import BaseModel
+
+    load_dotenv()
+
+    class Person(BaseModel):
+        name: str
+        age: int
+        city: str
+
+    parser = PydanticOutputParser(pydantic_object=Person)
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You are a helpful assistant."),
+        ("human", "Extract the person from: {text}\n\n{format_instructions}"),
+    ]).partial(format_instructions=parser.get_format_instructions())
+
+    #same prompt, two models; the parser is the cheap local validator
+    cascade = ModelCascade(
+        tiers=[
+            ("gpt-4o-mini", prompt | ChatOpenAI(model="gpt-4o-mini")),
+            ("gpt-4.1", prompt | ChatOpenAI(model="gpt-4.1")),
+        ],
+        validator=parser,
+    )
+
+    for text in ["Amey is 30 and lives in Pune", "Rahul, twenty-five, from Mumbai"]:
+        print(cascade.invoke({"text": text}))
+
+    print(cascade.stats())
+    #{'requests': 2, 'served_fraction': {'gpt-4o-mini': 1.0, 'gpt-4.1': 0.0}, 'tiers': {...}}
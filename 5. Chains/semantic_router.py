@@ -0,0 +1,236 @@
+#Semantic router: route by embedding similarity instead of asking an LLM for a label
+#
+#Section 7 of langchain_v_1_chains_overview.md calls a router LLM first:
+#   question --> [router prompt | gpt-4o-mini | StrOutputParser] --> "math" --> math_chain
+#That is a whole model round trip before any real work starts.
+#
+#Here each route is described by a few example utterances. They are embedded ONCE and kept
+#in memory as unit vectors; a question is then routed by
+#   - "centroid": cosine similarity to the mean vector of every route, or
+#   - "knn":      similarity-weighted vote of the k nearest examples,
+#which is one float32 matrix-vector product. The router LLM is only used as a fallback when the
+#best score is below `threshold`.
+
+import threading
+from collections import defaultdict
+from typing import Any, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import patch_config
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    """Rows (or a single vector) scaled to unit length; zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class SemanticRouter(Runnable):
+    """Dispatch an input to one of ``destinations`` by nearest route in embedding space.
+
+    routes:        {"math": ["Integrate x^2", ...], "code": [...], ...}
+    embeddings:    any LangChain Embeddings (OpenAIEmbeddings, ...)
+    destinations:  {"math": math_chain, ...}; if None the router just returns the label
+    default:       label used when neither the index nor the fallback gives a known route
+    fallback:      Runnable returning a label (e.g. the section 7 ``label_chain``),
+                   only called when confidence < threshold
+    input_key:     key holding the text when the input is a dict
+    """
+
+    def __init__(
+        self,
+        routes: dict[str, list[str]],
+        embeddings: Embeddings,
+        destinations: Optional[dict[str, Runnable]] = None,
+        default: Optional[str] = None,
+        fallback: Optional[Runnable] = None,
+        threshold: float = 0.75,
+        strategy: str = "centroid",
+        k: int = 5,
+        input_key: str = "question",
+    ):
+        if strategy not in ("centroid", "knn"):
+            raise ValueError(f"strategy must be 'centroid' or 'knn', got {strategy!r}")
+        if default is not None and default not in routes:
+            raise ValueError(f"default route {default!r} is not one of {list(routes)}")
+        self.routes = routes
+        self.embeddings = embeddings
+        self.destinations = destinations
+        self.default = default
+        self.fallback = fallback
+        self.threshold = threshold
+        self.strategy = strategy
+        self.k = k
+        self.input_key = input_key
+
+        self.labels = list(routes)
+        #fallback replies are matched case-insensitively, route keys keep their case
+        self._by_lower = {label.lower(): label for label in routes}
+        self._examples: Optional[np.ndarray] = None  # (n_examples, dim) float32 unit rows
+        self._example_labels = np.empty(0, dtype=np.intp)  # row -> index into self.labels
+        self._centroids: Optional[np.ndarray] = None  # (n_routes, dim) float32 unit rows
+        self._build_lock = threading.Lock()
+        self.counts = defaultdict(int)  # "semantic" / "fallback" / "below_threshold" decisions
+
+    # ---- index ------------------------------------------------------------------
+
+    def _example_texts(self) -> list[str]:
+        return [text for texts in self.routes.values() for text in texts]
+
+    def _index(self, vectors: list[list[float]]) -> None:
+        #caller holds _build_lock; _examples is set last, it is the "built" flag
+        labels = np.array([i for i, texts in enumerate(self.routes.values()) for _ in texts], dtype=np.intp)
+        examples = _normalize(np.asarray(vectors, dtype=np.float32))
+        sums = np.zeros((len(self.labels), examples.shape[1]), dtype=np.float32)
+        np.add.at(sums, labels, examples)
+        self._centroids = _normalize(sums)  # mean direction; a route without examples stays all-zero
+        self._example_labels = labels
+        self._examples = examples
+
+    def build(self) -> None:
+        """Embed every example utterance in one embed_documents call (idempotent)."""
+        with self._build_lock:
+            if self._examples is None:
+                self._index(self.embeddings.embed_documents(self._example_texts()))
+
+    async def abuild(self) -> None:
+        """``build`` with aembed_documents, so the first async request does not block the event loop."""
+        if self._examples is not None:
+            return
+        #concurrent first requests may each embed once; only the first result is kept
+        vectors = await self.embeddings.aembed_documents(self._example_texts())
+        with self._build_lock:
+            if self._examples is None:
+                self._index(vectors)
+
+    def score(self, vector: list[float]) -> tuple[str, float]:
+        """Best (label, confidence) for an already embedded query."""
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        if self.strategy == "centroid":
+            similarities = self._centroids @ query
+            best = int(similarities.argmax())
+            return self.labels[best], float(similarities[best])
+        similarities = self._examples @ query
+        k = min(self.k, len(similarities))
+        nearest = np.argpartition(-similarities, k - 1)[:k]
+        nearest_labels = self._example_labels[nearest]
+        votes = np.bincount(nearest_labels, weights=np.maximum(similarities[nearest], 0.0),
+                            minlength=len(self.labels))
+        best = int(votes.argmax())
+        #confidence = mean similarity of the neighbours that voted for the winner,
+        #scaled by the share of the vote it got
+        total = votes.sum() or 1.0
+        winners = similarities[nearest][nearest_labels == best]
+        return self.labels[best], float(winners.mean() * (votes[best] / total))
+
+    # ---- routing ----------------------------------------------------------------
+
+    def _text(self, input: Any) -> str:
+        return input[self.input_key] if isinstance(input, dict) else str(input)
+
+    def _decide(self, label: str, confidence: float) -> Optional[str]:
+        if confidence >= self.threshold:
+            self.counts["semantic"] += 1
+            return label
+        return None
+
+    def _from_fallback(self, raw: Any) -> str:
+        self.counts["fallback"] += 1
+        label = getattr(raw, "content", raw)
+        label = str(label).strip()
+        if label in self.routes:
+            return label
+        if label.lower() in self._by_lower:
+            return self._by_lower[label.lower()]
+        if self.default is None:
+            raise ValueError(f"Router fallback returned unknown route {label!r}")
+        return self.default
+
+    def route(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
+        """Return the route label for ``input`` without running the destination."""
+        self.build()
+        text = self._text(input)
+        label, confidence = self.score(self.embeddings.embed_query(text))
+        decided = self._decide(label, confidence)
+        if decided is not None:
+            return decided
+        if self.fallback is None:
+            self.counts["below_threshold"] += 1
+            return label if self.default is None else self.default
+        fallback_input = {self.input_key: text} if not isinstance(input, dict) else input
+        return self._from_fallback(self.fallback.invoke(fallback_input, config))
+
+    async def aroute(self, input: Any, config: Optional[RunnableConfig] = None) -> str:
+        await self.abuild()
+        text = self._text(input)
+        label, confidence = self.score(await self.embeddings.aembed_query(text))
+        decided = self._decide(label, confidence)
+        if decided is not None:
+            return decided
+        if self.fallback is None:
+            self.counts["below_threshold"] += 1
+            return label if self.default is None else self.default
+        fallback_input = {self.input_key: text} if not isinstance(input, dict) else input
+        return self._from_fallback(await self.fallback.ainvoke(fallback_input, config))
+
+    def _invoke(self, input: Any, run_manager, config: RunnableConfig) -> Any:
+        label = self.route(input, patch_config(config, callbacks=run_manager.get_child("router")))
+        if self.destinations is None:
+            return label
+        chain = self.destinations[label]
+        return chain.invoke(input, patch_config(config, callbacks=run_manager.get_child(label)))
+
+    async def _ainvoke(self, input: Any, run_manager, config: RunnableConfig) -> Any:
+        label = await self.aroute(input, patch_config(config, callbacks=run_manager.get_child("router")))
+        if self.destinations is None:
+            return label
+        chain = self.destinations[label]
+        return await chain.ainvoke(input, patch_config(config, callbacks=run_manager.get_child(label)))
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self._call_with_config(self._invoke, input, config)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self._acall_with_config(self._ainvoke, input, config)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.output_parsers import StrOutputParser
+
+    load_dotenv()
+
+    llm = ChatOpenAI(model="gpt-4o-mini")
+
+    def expert(kind):
+        return ChatPromptTemplate.from_messages([
+            ("system", f"You are a {kind} expert."),
+            ("user", "{question}"),
+        ]) | llm | StrOutputParser()
+
+    #the section 7 LLM router, now only used when the embedding match is unsure
+    label_chain = ChatPromptTemplate.from_messages([
+        ("system", "You are a router that assigns the label: math, code, or general. Reply with the label only."),
+        ("user", "Decide the label for: {question}"),
+    ]) | llm | StrOutputParser()
+
+    router = SemanticRouter(
+        routes={
+            "math": ["Integrate x^2", "What is the derivative of sin x?", "Solve 2x + 3 = 7"],
+            "code": ["Write a Python function to reverse a list", "Why does my for loop never end?", "Explain this SQL query"],
+            "general": ["What is the capital of France?", "Tell me a fact about Mars", "Who wrote Hamlet?"],
+        },
+        embeddings=OpenAIEmbeddings(),
+        destinations={"math": expert("math"), "code": expert("programming"), "general": expert("general knowledge")},
+        default="general",
+        fallback=label_chain,
+        threshold=0.80,
+    )
+
+    print(router.route({"question": "Integrate x^3 from 0 to 1"}))   #math, no router LLM call
+    print(router.invoke({"question": "How do I sort a dict by value in Python?"}))
+    print(dict(router.counts))
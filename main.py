@@ -1,5 +1,214 @@
-def main():
-    print("Hello from langchain-project!")
+#Command line entry point
+#
+#   python main.py ingest "4. Data Connections/penguins.csv" paper.pdf https://docs.langchain.com/
+#   python main.py query "What is the pdf about" --k 4
+#   python main.py serve --port 8765
+#   python main.py check-startup --budget-ms 50
+#
+#Startup cost of a short CLI job is mostly imports: langchain_community's loaders,
+#langchain_openai, langchain_chroma/chromadb and pypdf each take tens to hundreds of ms.
+#So this module imports only the standard library at top level; every subcommand imports
+#what it needs inside its handler, and loaders are looked up by file type on demand
+#(a CSV ingest never imports pypdf). `check-startup` runs `python -X importtime main.py --help`
+#and fails if the CLI startup imports exceed the budget or pull in a provider/loader module.
+#
+#--fake on ingest/query/serve uses the offline providers from "4. Data Connections/fake_providers.py"
+#(keep a separate --persist-directory: fake and OpenAI embeddings have different sizes).
+
+import argparse
+import importlib
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+PERSIST_DIRECTORY = ROOT / "4. Data Connections" / "chroma_db_all_docs"
+
+#suffix -> (module, loader class); imported only for the file types actually ingested
+LOADERS = {
+    ".pdf": ("langchain_community.document_loaders", "PyPDFLoader"),
+    ".csv": ("langchain_community.document_loaders", "CSVLoader"),
+    ".txt": ("langchain_community.document_loaders", "TextLoader"),
+    ".md": ("langchain_community.document_loaders", "TextLoader"),
+}
+WEB_LOADER = ("langchain_community.document_loaders", "WebBaseLoader")
+
+#must not be imported just to start the CLI / print --help
+HEAVY_MODULES = ("langchain_community", "langchain_openai", "langchain_chroma", "chromadb", "pypdf",
+                 "langchain_core", "numpy")
+
+
+def load_module(relative_path: str):
+    """Import a .py file from one of the numbered folders ("4. Data Connections" is not a valid package name)."""
+    path = ROOT / relative_path
+    sys.path.insert(0, str(path.parent))  # sibling imports like `from fake_providers import ...`
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[path.stem] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def _providers(fake: bool):
+    """(embedding, chat model), imported on first use."""
+    if fake:
+        fake_providers = load_module("4. Data Connections/fake_providers.py")
+        return fake_providers.FakeEmbeddings(), fake_providers.FakeChatModel()
+    from dotenv import load_dotenv
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+    load_dotenv()
+    return OpenAIEmbeddings(), ChatOpenAI()
+
+
+def _loader_for(source: str):
+    if source.startswith(("http://", "https://")):
+        module, name = WEB_LOADER
+    else:
+        suffix = Path(source).suffix.lower()
+        if suffix not in LOADERS:
+            raise SystemExit(f"don't know how to load {source!r} (supported: {', '.join(LOADERS)}, http(s) URLs)")
+        module, name = LOADERS[suffix]
+    return getattr(importlib.import_module(module), name)
+
+
+# ---- subcommands ------------------------------------------------------------------
+
+
+def ingest(args: argparse.Namespace) -> None:
+    """Load -> split -> embed -> store, like Simple RAG.py, into a persisted Chroma collection."""
+    from langchain_chroma import Chroma
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    docs = []
+    for source in args.sources:
+        loader = _loader_for(source)
+        docs.extend(loader(source, encoding="utf-8").load() if loader.__name__ == "TextLoader"
+                    else loader(source).load())
+    chunks = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap
+    ).split_documents(docs)
+    embedding, _ = _providers(args.fake)
+    Chroma.from_documents(documents=chunks, embedding=embedding, persist_directory=str(args.persist_directory))
+    print(f"ingested {len(docs)} documents as {len(chunks)} chunks into {args.persist_directory}")
+
+
+def query(args: argparse.Namespace) -> None:
+    import asyncio
+    import json
+
+    rag_server = load_module("4. Data Connections/rag_server.py")
+    embedding, llm = _providers(args.fake)
+    index = rag_server.ChromaIndex.from_persisted(args.persist_directory, embedding)
+    server = rag_server.RagServer(embedding, index, llm, k=args.k, window=0)
+    answer = asyncio.run(server.answer(" ".join(args.question)))
+    print(json.dumps(answer.model_dump(), indent=2))
+
+
+def serve(args: argparse.Namespace) -> None:
+    import asyncio
+
+    rag_server = load_module("4. Data Connections/rag_server.py")
+    embedding, llm = _providers(args.fake)
+    index = rag_server.ChromaIndex.from_persisted(args.persist_directory, embedding)
+    server = rag_server.RagServer(embedding, index, llm, k=args.k, window=args.window_ms / 1000)
+    asyncio.run(server.serve_forever(args.host, args.port))
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """(module, depth, self_us, cumulative_us) for each line of ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name[1:]  # one separator space, then two spaces per nesting level
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def _import_rows(*argv: str) -> list[tuple[str, int, int, int]]:
+    import subprocess
+
+    result = subprocess.run([sys.executable, "-X", "importtime", *argv], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f"`{' '.join(argv)}` failed:\n{result.stderr}")
+    return parse_importtime(result.stderr)
+
+
+def check_startup(args: argparse.Namespace) -> None:
+    """Time the imports of `main.py --help` in a fresh interpreter and enforce the budget.
+
+    Only imports the bare interpreter does not already do (`python -c pass`: site, encodings,
+    .pth files of the environment) count against the budget.
+    """
+    interpreter = {name for name, *_ in _import_rows("-c", "pass")}
+    best = None
+    for _ in range(args.runs):  # best of N: the first run may pay for a cold disk cache
+        rows = _import_rows(str(Path(__file__).resolve()), "--help")
+        added = [r for r in rows if r[1] == 0 and r[0] not in interpreter]
+        total_ms = sum(cumulative for *_, cumulative in added) / 1000
+        if best is None or total_ms < best[0]:
+            best = (total_ms, rows, added)
+
+    total_ms, rows, added = best
+    print(f"startup imports: {total_ms:.1f} ms on top of the bare interpreter "
+          f"(budget {args.budget_ms:.0f} ms, best of {args.runs})")
+    for name, _, _, cumulative in sorted(added, key=lambda r: r[3], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    heavy = sorted({name for name, *_ in rows if name.split(".")[0] in HEAVY_MODULES})
+    problems = []
+    if heavy:
+        problems.append(f"imported at startup: {', '.join(heavy)}")
+    if total_ms > args.budget_ms:
+        problems.append(f"{total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    if problems:
+        raise SystemExit("FAIL: " + "; ".join(problems))
+    print("OK")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py", description="LangChain RAG command line")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def rag_options(command: argparse.ArgumentParser) -> None:
+        command.add_argument("--persist-directory", type=Path, default=PERSIST_DIRECTORY)
+        command.add_argument("--fake", action="store_true", help="offline fake embeddings / chat model")
+
+    p = commands.add_parser("ingest", help="load, split, embed and store documents")
+    p.add_argument("sources", nargs="+", help="files (.pdf, .csv, .txt, .md) or http(s) URLs")
+    p.add_argument("--chunk-size", type=int, default=200)
+    p.add_argument("--chunk-overlap", type=int, default=50)
+    rag_options(p)
+    p.set_defaults(handler=ingest)
+
+    p = commands.add_parser("query", help="answer one question from the persisted index")
+    p.add_argument("question", nargs="+")
+    p.add_argument("--k", type=int, default=4)
+    rag_options(p)
+    p.set_defaults(handler=query)
+
+    p = commands.add_parser("serve", help="JSON-lines RAG server over TCP (see rag_server.py)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--k", type=int, default=4)
+    p.add_argument("--window-ms", type=float, default=5, help="retrieval micro-batch window")
+    rag_options(p)
+    p.set_defaults(handler=serve)
+
+    p = commands.add_parser("check-startup", help="fail if CLI startup imports exceed a time budget")
+    p.add_argument("--budget-ms", type=float, default=50)
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    p.set_defaults(handler=check_startup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
 
 
 if __name__ == "__main__":